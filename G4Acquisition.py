@@ -0,0 +1,422 @@
+import ctypes as ct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from G4Track import *
+from G4Arrays import frame_dtype
+from G4Clock import ClockModel
+
+
+class FrameRingBuffer:
+    """
+    Fixed-size ring buffer of G4FrameData with the host time at which each frame was read. There is a single
+    writer (the acquisition thread), any number of consumers read in batches with their own 'RingReader'. No lock
+    is needed: the writer only moves 'write_count' forward after a frame is completely written, a reader checks
+    after copying whether the writer overtook it in the meantime.
+
+    :Attributes:
+    - capacity:     number of frames the buffer holds (a reader can be at most capacity - 1 frames behind)
+    - frames:       contiguous array of G4FrameData
+    - timestamps:   host time (time.perf_counter) of each frame
+    - write_count:  total number of frames written since the creation of the buffer
+    """
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.frames = (G4FrameData * capacity)()
+        self.timestamps = (ct.c_double * capacity)()
+        self.write_count = 0
+        self._frame_size = ct.sizeof(G4FrameData)
+        self._frames_address = ct.addressof(self.frames)
+        self._timestamps_address = ct.addressof(self.timestamps)
+
+    def write(self, fd, timestamp):
+        """
+        Append a copy of a frame, the oldest frame is overwritten when the buffer is full
+        :param fd: frame to append
+        :type fd: G4FrameData
+        :param timestamp: host time of the frame
+        :type timestamp: float
+        """
+        i = self.write_count % self.capacity
+        ct.memmove(self._frames_address + i * self._frame_size, ct.addressof(fd), self._frame_size)
+        self.timestamps[i] = timestamp
+        self.write_count += 1
+
+    def reader(self, from_start=False):
+        """
+        Create a consumer of this buffer
+        :param from_start: True to start at the oldest frame still in the buffer, otherwise only new frames are read
+        :type from_start: bool
+        :return: a reader with its own position in the buffer
+        :rtype: RingReader
+        """
+        return RingReader(self, from_start)
+
+    def latest(self, out=None):
+        """
+        Get a copy of the most recent frame
+        :param out: frame to copy into (None to create one)
+        :type out: G4FrameData
+        :return: the frame and its host time, or (None, None) if nothing was written yet
+        :rtype: (G4FrameData, float)
+        """
+        count = self.write_count
+        if count == 0:
+            return None, None
+        if out is None:
+            out = G4FrameData()
+        i = (count - 1) % self.capacity
+        ct.memmove(ct.addressof(out), self._frames_address + i * self._frame_size, self._frame_size)
+        return out, self.timestamps[i]
+
+
+class RingReader:
+    """
+    Consumer of a FrameRingBuffer, reads all frames it did not read before in batches
+
+    :Attributes:
+    - ring:         the buffer
+    - position:     write_count of the buffer up to which this reader has read
+    - overflows:    number of frames overwritten (or being overwritten) before this reader could read them
+    """
+    def __init__(self, ring, from_start=False):
+        self.ring = ring
+        self.position = max(0, ring.write_count - ring.capacity + 1) if from_start else ring.write_count
+        self.overflows = 0
+
+    def available(self):
+        """
+        :return: number of frames waiting to be read (can be more than the capacity after an overflow)
+        :rtype: int
+        """
+        return self.ring.write_count - self.position
+
+    def read(self, out, out_timestamps=None):
+        """
+        Copy the waiting frames (at most len(out)) into out, oldest first
+        :param out: array of G4FrameData to copy the frames into
+        :type out: ct.Array[G4FrameData]
+        :param out_timestamps: array of ct.c_double (at least as long as out) for the host times (None if not needed)
+        :type out_timestamps: ct.Array[ct.c_double]
+        :return: number of frames copied
+        :rtype: int
+        """
+        ring = self.ring
+        capacity = ring.capacity
+        frame_size = ring._frame_size
+        double_size = ct.sizeof(ct.c_double)
+
+        # while write_count is W, the writer may be overwriting the slot of frame W - capacity: only the frames
+        # from W - capacity + 1 on are safe to copy
+        end = ring.write_count
+        if end - self.position > capacity - 1:
+            self.overflows += end - capacity + 1 - self.position
+            self.position = end - capacity + 1
+        n = min(end - self.position, len(out))
+        if n == 0:
+            return 0
+
+        # copy in (at most) two contiguous parts, the buffer can wrap around
+        out_address = ct.addressof(out)
+        start = self.position % capacity
+        first = min(n, capacity - start)
+        ct.memmove(out_address, ring._frames_address + start * frame_size, first * frame_size)
+        if first < n:
+            ct.memmove(out_address + first * frame_size, ring._frames_address, (n - first) * frame_size)
+        if out_timestamps is not None:
+            times_address = ct.addressof(out_timestamps)
+            ct.memmove(times_address, ring._timestamps_address + start * double_size, first * double_size)
+            if first < n:
+                ct.memmove(times_address + first * double_size, ring._timestamps_address,
+                           (n - first) * double_size)
+
+        # frames overwritten by the writer during the copy are not valid, drop them from the front
+        overwritten = ring.write_count - capacity + 1 - self.position
+        if overwritten > 0:
+            overwritten = min(overwritten, n)
+            self.overflows += overwritten
+            n -= overwritten
+            ct.memmove(out_address, out_address + overwritten * frame_size, n * frame_size)
+            if out_timestamps is not None:
+                ct.memmove(times_address, times_address + overwritten * double_size, n * double_size)
+            self.position += overwritten
+
+        self.position += n
+        return n
+
+
+class AcquisitionEngine:
+    """
+    Background thread reading the frames of some hubs at the frame rate of the system into a FrameRingBuffer.
+    A frame is only stored once (deduplicated on G4FrameData.frame per hub), missing frame numbers are counted as
+    dropped frames.
+
+    :Attributes:
+    - system_id:        system id (result of the function initialize_system)
+    - hub_id_list:      hubs to read
+    - ring:             buffer receiving the frames
+    - frame_rate:       polling rate in Hz (by default the frame rate of the system, G4_CMD_FRAMERATE)
+    - frames_read:      number of new frames stored in the ring
+    - duplicate_reads:  number of reads returning a frame that was already stored
+    - empty_reads:      number of reads without data
+    - dropped_frames:   number of frame numbers skipped by the device between two stored frames
+    """
+    def __init__(self, system_id, hub_id_list, ring=None, capacity=1024, frame_rate=None):
+        self.system_id = system_id
+        self.hub_id_list = list(hub_id_list)
+        self.ring = FrameRingBuffer(capacity) if ring is None else ring
+        if frame_rate is None:
+            frame_rate = get_frame_rate(system_id) or 120
+        self.frame_rate = frame_rate
+        self.frames_read = 0
+        self.duplicate_reads = 0
+        self.empty_reads = 0
+        self.dropped_frames = 0
+        self.last_frames = {}
+        self._reader = FrameReader(system_id, self.hub_id_list)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the acquisition thread
+        """
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"G4Acquisition-{self.system_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the acquisition thread and wait for it to end
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def poll(self):
+        """
+        Read all hubs once and store the new frames in the ring
+        :return: number of new frames
+        :rtype: int
+        """
+        frames, valid, active_hubs, hub_count = self._reader.read_hubs()
+        timestamp = time.perf_counter()
+        if hub_count == 0:
+            self.empty_reads += 1
+            return 0
+
+        new_frames = 0
+        for i, hub_id in enumerate(self.hub_id_list):
+            if not valid[i]:
+                continue
+            fd = frames[i]
+            frame = fd.frame
+            last_frame = self.last_frames.get(hub_id)
+            if last_frame is not None:
+                if frame == last_frame:
+                    self.duplicate_reads += 1
+                    continue
+                if frame > last_frame + 1:
+                    self.dropped_frames += frame - last_frame - 1
+            self.last_frames[hub_id] = frame
+            self.ring.write(fd, timestamp)
+            new_frames += 1
+
+        self.frames_read += new_frames
+        return new_frames
+
+    def _run(self):
+        period = 1 / self.frame_rate
+        next_time = time.perf_counter()
+        while not self._stop_event.is_set():
+            self.poll()
+            next_time += period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                # too slow to keep up, restart the schedule instead of polling in a burst
+                next_time = time.perf_counter()
+
+
+def wait_until_stable(sys_id, hub_id, tolerance=0.1, stable_frames=10, timeout=5.0, frame_rate=None):
+    """
+    Wait until the hub delivers frames and the positions of its active sensors have settled (e.g. while the
+    hemisphere of the source adapts after the initialization or after a frame of reference change): the position
+    of every active sensor must change less than tolerance between consecutive frame numbers for stable_frames
+    frames in a row.
+    :param sys_id: system id
+    :type sys_id: int
+    :param hub_id: hub id
+    :type hub_id: int
+    :param tolerance: maximum change of a position coordinate between two frames (in the position unit)
+    :type tolerance: float
+    :param stable_frames: number of consecutive stable frames needed
+    :type stable_frames: int
+    :param timeout: maximum time to wait in seconds
+    :type timeout: float
+    :param frame_rate: frame rate of the system (None to ask the system)
+    :type frame_rate: int
+    :return: a copy of the last frame, None if the data did not settle before the timeout
+    :rtype: G4FrameData
+    """
+    if frame_rate is None:
+        frame_rate = get_frame_rate(sys_id) or 120
+    reader = FrameReader(sys_id, [hub_id])
+    last = G4FrameData()
+    last_frame = None
+    stable_count = 0
+    end_time = time.perf_counter() + timeout
+
+    while time.perf_counter() < end_time:
+        fd, active_hubs, hub_count = reader.read()
+        if hub_count > 0 and fd.stationMap != 0 and fd.frame != last_frame:
+            if last_frame is not None:
+                difference = max(abs(fd.G4_sensor_per_hub[i].pos[j] - last.G4_sensor_per_hub[i].pos[j])
+                                 for i in range(G4_sensors_per_hub) if fd.stationMap >> i & 1
+                                 for j in range(3))
+                stable_count = stable_count + 1 if difference <= tolerance else 0
+            ct.memmove(ct.addressof(last), ct.addressof(fd), ct.sizeof(G4FrameData))
+            last_frame = fd.frame
+            if stable_count >= stable_frames:
+                return last
+        time.sleep(0.5 / frame_rate)
+
+    print(f"Error: No stable data of hub {hub_id} within {timeout} s.")
+    return None
+
+
+# frame of a merged multi-system feed, id is create_id(system, hub, 0), time is the host time of the measurement
+# according to the clock model of the system
+merged_dtype = np.dtype([("timestamp", np.float64),
+                         ("time", np.float64),
+                         ("id", np.int64),
+                         ("fd", frame_dtype)])
+
+
+class MultiSystemManager:
+    """
+    Several systems (dongles) at once: they are initialized in parallel, each system gets its own
+    AcquisitionEngine on all its active hubs and 'read' merges their frames into one feed. The frame counter of
+    each hub is mapped to host time by its own ClockModel (the counters of the hubs are not aligned), so the feed is
+    ordered on the time of the measurements and not on the jittery time of the reads.
+
+    :Attributes:
+    - src_cfg_files:    source configuration file (.g4c) of each system
+    - system_ids:       ids of the initialized systems
+    - engines:          acquisition engine of each system, by system id
+    - clocks:           clock model of each hub, by (system id, hub id)
+    """
+    def __init__(self, src_cfg_files, capacity=1024, frame_rate=None, batch_frames=1024):
+        self.src_cfg_files = list(src_cfg_files)
+        self.capacity = capacity
+        self.frame_rate = frame_rate
+        self.batch_frames = batch_frames
+        self.system_ids = []
+        self.engines = {}
+        self.clocks = {}
+        self._readers = {}
+        self._frames = {}
+        self._timestamps = {}
+
+    def start(self):
+        """
+        Initialize all systems in parallel and start one acquisition thread per system with active hubs. If the
+        setup fails, the threads that were already started are stopped.
+        :return: the source configuration files of the systems that are not used (not initialized or without
+            active hubs), empty if all systems are used
+        :rtype: list[str]
+        """
+        with ThreadPoolExecutor(max_workers=max(len(self.src_cfg_files), 1)) as executor:
+            results = list(executor.map(initialize_system, self.src_cfg_files))
+
+        self.system_ids = []
+        unused = [src_cfg_file for src_cfg_file, (connected, sys_id) in zip(self.src_cfg_files, results)
+                  if not connected]
+        try:
+            for src_cfg_file, (connected, sys_id) in zip(self.src_cfg_files, results):
+                if not connected:
+                    continue
+                hub_id_list = get_active_hubs(sys_id, True)
+                if not hub_id_list:
+                    print(f"Error: No active hubs on system {sys_id} ({src_cfg_file}).")
+                    unused.append(src_cfg_file)
+                    continue
+                engine = AcquisitionEngine(sys_id, hub_id_list, capacity=self.capacity, frame_rate=self.frame_rate)
+                self.system_ids.append(sys_id)
+                self.engines[sys_id] = engine
+                for hub_id in hub_id_list:
+                    self.clocks[(sys_id, hub_id)] = ClockModel(engine.frame_rate)
+                self._readers[sys_id] = engine.ring.reader()
+                self._frames[sys_id] = (G4FrameData * self.batch_frames)()
+                self._timestamps[sys_id] = (ct.c_double * self.batch_frames)()
+                engine.start()
+        except Exception:
+            self.stop()
+            raise
+        return unused
+
+    def read(self):
+        """
+        Get the new frames of all systems (at most batch_frames per system)
+        :return: structured array with dtype merged_dtype, ordered on time
+        :rtype: np.ndarray
+        """
+        parts = []
+        for sys_id in self.system_ids:
+            frames, timestamps = self._frames[sys_id], self._timestamps[sys_id]
+            n = self._readers[sys_id].read(frames, timestamps)
+            if n == 0:
+                continue
+            part = np.empty(n, dtype=merged_dtype)
+            part["fd"] = np.frombuffer(frames, dtype=frame_dtype)[:n]
+            part["timestamp"] = np.frombuffer(timestamps, dtype=np.float64)[:n]
+            part["id"] = create_id(sys_id, part["fd"]["hub"].astype(np.int64), 0)
+            hubs = part["fd"]["hub"]
+            for hub_id in np.unique(hubs):
+                rows = hubs == hub_id
+                part["time"][rows] = self.clocks[(sys_id, int(hub_id))].update(part["fd"]["frame"][rows],
+                                                                              part["timestamp"][rows])
+            parts.append(part)
+
+        if not parts:
+            return np.empty(0, dtype=merged_dtype)
+        merged = np.concatenate(parts)
+        return merged[np.argsort(merged["time"], kind="stable")]
+
+    def overflows(self):
+        """
+        :return: per system, the number of frames lost because 'read' was not called often enough
+        :rtype: dict[int, int]
+        """
+        return {sys_id: reader.overflows for sys_id, reader in self._readers.items()}
+
+    def stop(self):
+        """
+        Stop all acquisition threads in parallel and close the connection with all systems (g4_close_tracker)
+        """
+        if self.engines:
+            with ThreadPoolExecutor(max_workers=len(self.engines)) as executor:
+                list(executor.map(AcquisitionEngine.stop, self.engines.values()))
+        close_sensor()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
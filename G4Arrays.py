@@ -0,0 +1,88 @@
+import ctypes as ct
+
+import numpy as np
+
+from G4Track import *
+
+# same memory layout as G4SensorFrameData and G4FrameData
+sensor_dtype = np.dtype([("id", np.uint32),
+                         ("pos", np.float32, (3,)),
+                         ("ori", np.float32, (4,))])
+
+frame_dtype = np.dtype([("hub", np.uint32),
+                        ("frame", np.uint32),
+                        ("stationMap", np.uint32),
+                        ("dig_io", np.uint32),
+                        ("G4_sensor_per_hub", sensor_dtype, (G4_sensors_per_hub,))])
+
+assert sensor_dtype.itemsize == ct.sizeof(G4SensorFrameData)
+assert frame_dtype.itemsize == ct.sizeof(G4FrameData)
+
+
+def frames_view(frames):
+    """
+    Zero-copy view of ctypes frame data as a structured array, changes of the frames are visible in the view
+    :param frames: a G4FrameData or an array of G4FrameData
+    :type frames: G4FrameData | ct.Array[G4FrameData]
+    :return: structured array with dtype frame_dtype and shape (frames,)
+    :rtype: np.ndarray
+    """
+    return np.frombuffer(frames, dtype=frame_dtype)
+
+
+def ring_view(ring):
+    """
+    Zero-copy view of all frames of a FrameRingBuffer, in the order of the buffer (not chronological, see
+    'ring_indices')
+    :param ring: the ring buffer
+    :type ring: G4Acquisition.FrameRingBuffer
+    :return: the structured array of frames and the array of host times
+    :rtype: (np.ndarray, np.ndarray)
+    """
+    return frames_view(ring.frames), np.frombuffer(ring.timestamps, dtype=np.float64)
+
+
+def ring_indices(ring, n=None):
+    """
+    Indices in the ring buffer of the most recent frames, oldest first
+    :param ring: the ring buffer
+    :type ring: G4Acquisition.FrameRingBuffer
+    :param n: number of frames (None for all frames in the buffer)
+    :type n: int
+    :return: array of indices to use on the views of 'ring_view'
+    :rtype: np.ndarray
+    """
+    end = ring.write_count
+    count = min(end, ring.capacity) if n is None else min(n, end, ring.capacity)
+    return np.arange(end - count, end) % ring.capacity
+
+
+def positions(view):
+    """
+    :param view: structured array with dtype frame_dtype
+    :type view: np.ndarray
+    :return: the positions, with shape (frames, sensors, 3) (a view, not a copy)
+    :rtype: np.ndarray
+    """
+    return view["G4_sensor_per_hub"]["pos"]
+
+
+def orientations(view):
+    """
+    :param view: structured array with dtype frame_dtype
+    :type view: np.ndarray
+    :return: the orientations, with shape (frames, sensors, 4) (a view, not a copy), the 4th element is not used
+        for Euler angles
+    :rtype: np.ndarray
+    """
+    return view["G4_sensor_per_hub"]["ori"]
+
+
+def active_sensors(view):
+    """
+    :param view: structured array with dtype frame_dtype
+    :type view: np.ndarray
+    :return: boolean array with shape (frames, sensors), True if the sensor is active according to the station map
+    :rtype: np.ndarray
+    """
+    return (view["stationMap"][:, None] >> np.arange(G4_sensors_per_hub, dtype=np.uint32)) & 1 == 1
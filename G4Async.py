@@ -0,0 +1,90 @@
+import asyncio
+import ctypes as ct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from G4Track import *
+
+
+class AsyncTracker:
+    """
+    asyncio interface to a system: the blocking calls of the G4Track library are done in a single worker thread,
+    so the event loop is never blocked and the calls are never concurrent.
+
+        async with contextlib.aclosing(tracker.stream([hub_id])) as stream:
+            async for fd, timestamp in stream:
+                ...
+
+    Cancelling the consuming task (or leaving the aclosing block) ends the stream with 'close_sensor'.
+
+    :Attributes:
+    - system_id:    system id (result of the function initialize_system)
+    - frame_rate:   rate in Hz at which the hubs are read (None to ask the system with G4_CMD_FRAMERATE)
+    - executor:     the worker thread of the blocking calls (shut down by 'close' only if created here)
+    """
+    def __init__(self, system_id, frame_rate=None, executor=None):
+        self.system_id = system_id
+        self.frame_rate = frame_rate
+        self._own_executor = executor is None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="G4Async") if executor is None \
+            else executor
+        self.closed = False
+
+    async def _call(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def stream(self, hub_id_list, close_on_exit=True):
+        """
+        Asynchronous iterator over the new frames of the given hubs, paced to the frame rate. Frames are only read
+        when the consumer asks for the next one (backpressure): a slow consumer skips frames, but nothing piles up.
+        :param hub_id_list: hubs to read
+        :type hub_id_list: list[int]
+        :param close_on_exit: True to close the connection with the sensor ('close_sensor') when the iteration ends,
+            is cancelled or fails
+        :type close_on_exit: bool
+        :return: per frame a copy of the G4FrameData and the host time (time.perf_counter) of the read
+        :rtype: AsyncIterator[(G4FrameData, float)]
+        """
+        if self.frame_rate is None:
+            self.frame_rate = await self._call(get_frame_rate, self.system_id) or 120
+        period = 1 / self.frame_rate
+        reader = FrameReader(self.system_id, hub_id_list)
+        last_frames = {}
+
+        try:
+            next_time = time.perf_counter()
+            while not self.closed:
+                frames, valid, active_hubs, hub_count = await self._call(reader.read_hubs)
+                timestamp = time.perf_counter()
+
+                new_frames = []
+                for i, hub_id in enumerate(reader.hub_id_list):
+                    if valid[i] and last_frames.get(hub_id) != frames[i].frame:
+                        last_frames[hub_id] = frames[i].frame
+                        fd = G4FrameData()
+                        ct.memmove(ct.addressof(fd), ct.addressof(frames[i]), ct.sizeof(G4FrameData))
+                        new_frames.append(fd)
+
+                for fd in new_frames:
+                    yield fd, timestamp
+
+                next_time += period
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    next_time = time.perf_counter()
+        finally:
+            if close_on_exit:
+                await asyncio.shield(self.close())
+
+    async def close(self):
+        """
+        Close the connection with the sensor, after the call that is still running in the worker thread
+        """
+        if self.closed:
+            return
+        self.closed = True
+        await self._call(close_sensor)
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
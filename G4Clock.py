@@ -0,0 +1,129 @@
+import numpy as np
+
+frame_counter_range = 1 << 32
+
+
+class ClockModel:
+    """
+    Online mapping from the frame counter of a system (G4FrameData.frame) to host time: host_time = offset + slope *
+    frame, fitted on the last frames. The slope follows the drift between the clocks of the device and the host.
+    The host time of a read is always after the measurement, with a random delay: the line is fitted by least
+    squares and then moved down to the earliest read, so the jitter of the reads is removed from the timestamps.
+
+    The counter is unwrapped when it passes 2^32. When it goes back or jumps by a number of frames that does not
+    match the elapsed host time (e.g. the system was reinitialized), the model restarts.
+
+    :Attributes:
+    - frame_rate:   nominal frame rate of the system in Hz
+    - window:       number of frames used for the fit
+    - tolerance:    difference in seconds between the frame counter and the host time that is taken as a reset
+    - slope:        fitted seconds per frame
+    - offset:       fitted host time of the frame base_frame
+    - base_frame:   unwrapped frame number at the start of the model
+    - wraps:        number of times the counter passed 2^32
+    - resets:       number of restarts of the model
+    """
+    def __init__(self, frame_rate=120, window=1024, tolerance=1.0):
+        self.frame_rate = frame_rate
+        self.window = window
+        self.tolerance = tolerance
+        self.slope = 1 / frame_rate
+        self.offset = None
+        self.base_frame = 0
+        self.wraps = 0
+        self.resets = 0
+        self._frames = np.zeros(window)
+        self._timestamps = np.zeros(window)
+        self._count = 0
+        self._last_frame = None
+        self._last_timestamp = None
+
+    @property
+    def drift_ppm(self):
+        """
+        :return: drift of the device clock compared to the host clock in parts per million (positive if the device
+            is slower than its nominal frame rate)
+        :rtype: float
+        """
+        return (self.slope * self.frame_rate - 1) * 1e6
+
+    def _restart(self, frame):
+        self.resets += self._last_frame is not None
+        self.slope = 1 / self.frame_rate
+        self.offset = None
+        self.base_frame = frame
+        self._count = 0
+
+    def _unwrap(self, frame):
+        frame = int(frame) + self.wraps * frame_counter_range
+        if self._last_frame is not None and frame < self._last_frame - frame_counter_range // 2:
+            self.wraps += 1
+            frame += frame_counter_range
+        return frame
+
+    def _fit(self):
+        n = min(self._count, self.window)
+        x, y = self._frames[:n], self._timestamps[:n]
+        if n >= 2 and x.max() - x.min() >= self.frame_rate:
+            # fit the slope only over at least one second, before that the nominal slope is more accurate
+            x_mean, y_mean = x.mean(), y.mean()
+            self.slope = np.sum((x - x_mean) * (y - y_mean)) / np.sum((x - x_mean) ** 2)
+            self.offset = y_mean - self.slope * x_mean
+        else:
+            self.offset = y[0] - self.slope * x[0]
+        self.offset += np.min(y - (self.offset + self.slope * x))
+
+    def update(self, frames, timestamps):
+        """
+        Add frames to the model
+        :param frames: frame numbers (G4FrameData.frame), in the order of the reads
+        :type frames: np.ndarray
+        :param timestamps: host times at which the frames were read (time.perf_counter)
+        :type timestamps: np.ndarray
+        :return: the host times of the frames according to the model
+        :rtype: np.ndarray
+        """
+        frames = np.atleast_1d(frames)
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=np.float64))
+        result = np.empty(len(frames))
+        start = 0
+        for i in range(len(frames)):
+            frame = self._unwrap(frames[i])
+            timestamp = timestamps[i]
+            if self._last_frame is None or frame < self._last_frame or \
+                    abs((frame - self._last_frame) / self.frame_rate - (timestamp - self._last_timestamp)) \
+                    > self.tolerance:
+                if start < i:
+                    self._fit()
+                    result[start:i] = self.times(frames[start:i])
+                    start = i
+                self._restart(frame)
+            self._last_frame = frame
+            self._last_timestamp = timestamp
+
+            row = self._count % self.window
+            self._frames[row] = frame - self.base_frame
+            self._timestamps[row] = timestamp
+            self._count += 1
+
+        if start < len(frames):
+            self._fit()
+            result[start:] = self.times(frames[start:])
+        return result
+
+    def times(self, frames):
+        """
+        Host times of frames that are close to the last frame of the model
+        :param frames: frame numbers (G4FrameData.frame)
+        :type frames: np.ndarray
+        :return: the host times (NaN before the first frame)
+        :rtype: np.ndarray
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        if self.offset is None:
+            return np.full(frames.shape, np.nan)
+        # unwrap relative to the last frame
+        last = self._last_frame
+        frames = frames + self.wraps * frame_counter_range
+        frames = np.where(frames > last + frame_counter_range // 2, frames - frame_counter_range, frames)
+        return self.offset + self.slope * (frames - self.base_frame)
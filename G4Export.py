@@ -0,0 +1,252 @@
+import os
+
+import numpy as np
+
+from G4Track import *
+from G4Clock import ClockModel
+from G4Recording import Recording, record_dtype
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+def orientation_axes(ori_unit=UNITS.G4_TYPE_EULER_DEGREE):
+    """
+    :param ori_unit: unit of the orientations
+    :type ori_unit: UNITS
+    :return: names of the orientation columns
+    :rtype: list[str]
+    """
+    if ori_unit == UNITS.G4_TYPE_QUATERNION:
+        return ["qw", "qx", "qy", "qz"]
+    return ["azimuth", "elevation", "roll"]
+
+
+def column_names(hub_ids, ori_unit=UNITS.G4_TYPE_EULER_DEGREE):
+    """
+    Columns of an export: the frame number, the host time of the read, the host time of the measurement
+    (see ClockModel) and per hub, sensor and axis the position and the orientation, e.g. 'h0_s1_x', 'h0_s1_azimuth'
+    :param hub_ids: exported hubs
+    :type hub_ids: list[int]
+    :param ori_unit: unit of the orientations
+    :type ori_unit: UNITS
+    :return: the names of the columns
+    :rtype: list[str]
+    """
+    axes = ["x", "y", "z"] + orientation_axes(ori_unit)
+    return ["frame", "timestamp", "time"] + [f"h{hub_id}_s{sensor}_{axis}" for hub_id in hub_ids
+                                            for sensor in range(G4_sensors_per_hub) for axis in axes]
+
+
+def recording_hubs(recording):
+    """
+    :param recording: the recording
+    :type recording: Recording
+    :return: the hubs in the recording
+    :rtype: list[int]
+    """
+    return sorted(recording.hub_index())
+
+
+def chunk_columns(records, hub_ids, ori_unit=UNITS.G4_TYPE_EULER_DEGREE, clock=None):
+    """
+    Table of a chunk of records with one row per frame number and one column per hub, sensor and axis (see
+    'column_names'), NaN for the sensors that are not active or the hubs without this frame
+    :param records: records of a recording (dtype record_dtype) with all hubs of each frame number
+    :type records: np.ndarray
+    :param hub_ids: exported hubs
+    :type hub_ids: list[int]
+    :param ori_unit: unit of the orientations
+    :type ori_unit: UNITS
+    :param clock: clock model giving the 'time' column, updated with the rows (None for NaN)
+    :type clock: ClockModel
+    :return: the columns by name
+    :rtype: dict[str, np.ndarray]
+    """
+    frames, rows = np.unique(records["fd"]["frame"], return_inverse=True)
+    hubs = np.searchsorted(hub_ids, records["fd"]["hub"])
+    known = (hubs < len(hub_ids)) & (np.asarray(hub_ids)[np.minimum(hubs, len(hub_ids) - 1)] == records["fd"]["hub"])
+    n_ori = len(orientation_axes(ori_unit))
+
+    sensors = records["fd"]["G4_sensor_per_hub"]
+    values = np.concatenate([sensors["pos"], sensors["ori"][..., :n_ori]], axis=-1).astype(np.float64)
+    active = (records["fd"]["stationMap"][:, None] >> np.arange(G4_sensors_per_hub, dtype=np.uint32)) & 1 == 1
+    values[~active] = np.nan
+
+    table = np.full((len(frames), len(hub_ids), G4_sensors_per_hub, 3 + n_ori), np.nan)
+    table[rows[known], hubs[known]] = values[known]
+    timestamps = np.full(len(frames), np.inf)
+    np.minimum.at(timestamps, rows, records["timestamp"])
+    times = clock.update(frames, timestamps) if clock is not None else np.full(len(frames), np.nan)
+
+    names = column_names(hub_ids, ori_unit)
+    columns = {"frame": frames.astype(np.int64), "timestamp": timestamps, "time": times}
+    columns.update(zip(names[3:], table.reshape(len(frames), -1).T))
+    return columns
+
+
+def _next_frame(hub_index, index):
+    # lowest frame number that a hub still has in the records from index on (None after the last record)
+    next_frame = None
+    for indices, frames in hub_index.values():
+        position = np.searchsorted(indices, index)
+        if position < len(indices) and (next_frame is None or frames[position] < next_frame):
+            next_frame = frames[position]
+    return next_frame
+
+
+def export_recording(path, out_path, hub_ids=None, chunk_records=65536, ori_unit=UNITS.G4_TYPE_EULER_DEGREE,
+                     frame_rate=120, file_format="parquet"):
+    """
+    Export a recording (see FrameRecorder) to a columnar Parquet or Arrow IPC file, in chunks of records so the
+    memory use does not depend on the length of the recording. Each chunk is a row group (Parquet) or a record
+    batch (Arrow). The frame counters of the hubs are not aligned: the records of a chunk with frame numbers that
+    another hub has not reached yet are carried over to the next chunk, so a frame number is one row (unless the
+    counters are more than a chunk apart). Needs pyarrow.
+    :param path: path of the recording
+    :type path: str
+    :param out_path: path of the exported file
+    :type out_path: str
+    :param hub_ids: hubs to export (None for all hubs in the recording)
+    :type hub_ids: list[int]
+    :param chunk_records: number of records read per chunk
+    :type chunk_records: int
+    :param ori_unit: unit of the recorded orientations
+    :type ori_unit: UNITS
+    :param frame_rate: frame rate of the system in Hz (for the clock model)
+    :type frame_rate: int
+    :param file_format: 'parquet' or 'arrow'
+    :type file_format: str
+    :return: the number of exported rows, None on error
+    :rtype: int
+    """
+    if pa is None:
+        print("Error: pyarrow is needed to export a recording.")
+        return None
+    if file_format not in ("parquet", "arrow"):
+        print(f"Error: Unknown export format {file_format}.")
+        return None
+
+    recording = Recording(path)
+    hub_index = recording.hub_index()
+    hub_ids = recording_hubs(recording) if hub_ids is None else sorted(hub_ids)
+    names = column_names(hub_ids, ori_unit)
+    schema = pa.schema([("frame", pa.int64()), ("timestamp", pa.float64()), ("time", pa.float64())]
+                       + [(name, pa.float32()) for name in names[3:]])
+    clock = ClockModel(frame_rate)
+    rows = 0
+    if len(recording) == 0:
+        return rows
+
+    writer = pq.ParquetWriter(out_path, schema) if file_format == "parquet" else pa.ipc.new_file(out_path, schema)
+    carry = np.zeros(0, dtype=record_dtype)
+    try:
+        for start in range(0, len(recording), chunk_records):
+            stop = min(start + chunk_records, len(recording))
+            records = np.concatenate([carry, recording[start:stop]]) if len(carry) else recording[start:stop]
+            next_frame = _next_frame(hub_index, stop)
+            carry = carry[:0]
+            if next_frame is not None:
+                later = records["fd"]["frame"] >= next_frame
+                if np.count_nonzero(later) <= chunk_records:
+                    carry = records[later]
+                    records = records[~later]
+            if len(records) == 0:
+                continue
+            columns = chunk_columns(records, hub_ids, ori_unit, clock)
+            batch = pa.record_batch([pa.array(columns[name], type=schema.field(name).type, from_pandas=True)
+                                     for name in names], schema=schema)
+            if file_format == "parquet":
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    return rows
+
+
+def _read_batches(path, batch_size):
+    if path.endswith(".arrow"):
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+    else:
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_size)
+
+
+def export_csv(path, csv_path, batch_size=65536):
+    """
+    Convert an export (Parquet, or Arrow IPC with the extension '.arrow') to CSV, batch per batch
+    :param path: path of the export
+    :type path: str
+    :param csv_path: path of the CSV file
+    :type csv_path: str
+    :param batch_size: number of rows per batch
+    :type batch_size: int
+    :return: the number of rows, None on error
+    :rtype: int
+    """
+    if pa is None:
+        print("Error: pyarrow is needed to convert an export.")
+        return None
+    rows = 0
+    writer = None
+    try:
+        for batch in _read_batches(path, batch_size):
+            if writer is None:
+                writer = pa_csv.CSVWriter(csv_path, batch.schema)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+excel_max_rows = 1048575  # without the header
+
+
+def export_excel(path, excel_path, step=None):
+    """
+    Convert an export (Parquet, or Arrow IPC with the extension '.arrow') to an Excel file (needs pandas and
+    openpyxl). Excel has at most 1048576 rows: longer exports need a step.
+    :param path: path of the export
+    :type path: str
+    :param excel_path: path of the Excel file (.xlsx)
+    :type excel_path: str
+    :param step: keep one row out of step (None for all rows)
+    :type step: int
+    :return: the number of rows, None on error
+    :rtype: int
+    """
+    if pa is None:
+        print("Error: pyarrow is needed to convert an export.")
+        return None
+    table = pa.Table.from_batches(list(_read_batches(path, 65536)))
+    if step is not None:
+        table = table.take(np.arange(0, table.num_rows, step))
+    if table.num_rows > excel_max_rows:
+        print(f"Error: {table.num_rows} rows do not fit in Excel, use a step of at least "
+              f"{-(-table.num_rows // excel_max_rows)}.")
+        return None
+    table.to_pandas().to_excel(excel_path, index=False)
+    return table.num_rows
+
+
+def export_recording_excel(path, excel_path, step=None):
+    """
+    Export a recording to an Excel file through a Parquet export next to it (see 'export_recording' and
+    'export_excel')
+    :return: the number of rows, None on error
+    :rtype: int
+    """
+    parquet_path = os.path.splitext(excel_path)[0] + ".parquet"
+    if export_recording(path, parquet_path) is None:
+        return None
+    return export_excel(parquet_path, excel_path, step)
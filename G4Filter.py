@@ -0,0 +1,229 @@
+import ctypes as ct
+
+import numpy as np
+
+from G4Track import *
+from G4Acquisition import FrameRingBuffer
+from G4Arrays import frames_view, positions, orientations, active_sensors
+from G4Transform import convert_orientations
+
+
+class StreamFilter:
+    """
+    Base of the host-side streaming filters. A filter keeps a fixed-size state per key (a hub) and per row (a
+    sensor): each update only uses the state and the new sample. Rows that are not active keep their state and are
+    restarted from the next sample when they become active again.
+
+    :Attributes:
+    - states:   per key, dict of state arrays with shape (rows, values)
+    """
+    def __init__(self):
+        self.states = {}
+
+    def reset(self, key=None):
+        """
+        Forget the state of one key (None for all keys)
+        """
+        if key is None:
+            self.states.clear()
+        else:
+            self.states.pop(key, None)
+
+    def update(self, key, x, dt, mask=None):
+        """
+        Filter one sample
+        :param key: key of the state (e.g. the hub id)
+        :type key: int
+        :param x: new sample with shape (rows, values)
+        :type x: np.ndarray
+        :param dt: time since the previous sample in seconds
+        :type dt: float
+        :param mask: rows to update with shape (rows,) (None for all rows)
+        :type mask: np.ndarray
+        :return: the filtered sample with shape (rows, values), x for the rows that are not updated
+        :rtype: np.ndarray
+        """
+        x = np.asarray(x, dtype=np.float64)
+        state = self.states.get(key)
+        if state is None or state["x"].shape != x.shape:
+            state = self.states[key] = self._initial_state(x)
+            state["started"] = np.zeros(x.shape[0], dtype=bool)
+        mask = np.ones(x.shape[0], dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+        new_state = self._initial_state(x)
+        started = state["started"][:, None]
+        if state["started"].any() and dt > 0:
+            stepped = self._step(state, x, dt)
+            new_state = {name: np.where(started, stepped[name], value) for name, value in new_state.items()}
+
+        update = mask[:, None]
+        for name, value in new_state.items():
+            state[name] = np.where(update, value, state[name])
+        state["started"] = mask
+        return np.where(update, state["x"], x)
+
+    def _initial_state(self, x):
+        return {"x": x.copy()}
+
+    def _step(self, state, x, dt):
+        raise NotImplementedError
+
+
+class ExponentialFilter(StreamFilter):
+    """
+    Exponential smoothing x_hat = x_hat + alpha (x - x_hat)
+
+    :Attributes:
+    - alpha:    weight of the new sample, between 0 (no change) and 1 (no smoothing)
+    """
+    def __init__(self, alpha=0.5):
+        super().__init__()
+        self.alpha = alpha
+
+    def _step(self, state, x, dt):
+        return {"x": state["x"] + self.alpha * (x - state["x"])}
+
+
+def _smoothing_factor(dt, cutoff):
+    tau = 1 / (2 * np.pi * cutoff)
+    return 1 / (1 + tau / dt)
+
+
+class OneEuroFilter(StreamFilter):
+    """
+    One-Euro filter (Casiez et al., CHI 2012): a low-pass filter whose cutoff frequency rises with the speed, so
+    there is little jitter at rest and little lag during fast motion
+
+    :Attributes:
+    - min_cutoff:   cutoff frequency in Hz at rest
+    - beta:         increase of the cutoff frequency per unit of speed
+    - d_cutoff:     cutoff frequency in Hz of the speed estimate
+    """
+    def __init__(self, min_cutoff=1.0, beta=0.01, d_cutoff=1.0):
+        super().__init__()
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+
+    def _initial_state(self, x):
+        return {"x": x.copy(), "dx": np.zeros_like(x)}
+
+    def _step(self, state, x, dt):
+        a_d = _smoothing_factor(dt, self.d_cutoff)
+        dx = state["dx"] + a_d * ((x - state["x"]) / dt - state["dx"])
+        a = _smoothing_factor(dt, self.min_cutoff + self.beta * np.abs(dx))
+        return {"x": state["x"] + a * (x - state["x"]), "dx": dx}
+
+
+class KalmanFilter(StreamFilter):
+    """
+    Constant-velocity Kalman filter, independent for each value: the state is the value and its velocity, the
+    acceleration is white noise
+
+    :Attributes:
+    - process_noise:        spectral density of the acceleration ((unit/s^2)^2 / Hz)
+    - measurement_noise:    variance of a sample (unit^2)
+    """
+    def __init__(self, process_noise=100.0, measurement_noise=0.01):
+        super().__init__()
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+
+    def _initial_state(self, x):
+        # covariance [[p00, p01], [p01, p11]] of (value, velocity)
+        return {"x": x.copy(), "v": np.zeros_like(x), "p00": np.full_like(x, self.measurement_noise),
+                "p01": np.zeros_like(x), "p11": np.full_like(x, self.process_noise)}
+
+    def _step(self, state, x, dt):
+        q = self.process_noise
+        # predict
+        x_pred = state["x"] + dt * state["v"]
+        p00 = state["p00"] + dt * (2 * state["p01"] + dt * state["p11"]) + q * dt ** 3 / 3
+        p01 = state["p01"] + dt * state["p11"] + q * dt ** 2 / 2
+        p11 = state["p11"] + q * dt
+        # correct
+        k0 = p00 / (p00 + self.measurement_noise)
+        k1 = p01 / (p00 + self.measurement_noise)
+        residual = x - x_pred
+        return {"x": x_pred + k0 * residual, "v": state["v"] + k1 * residual,
+                "p00": (1 - k0) * p00, "p01": (1 - k0) * p01, "p11": p11 - k1 * p01}
+
+
+class FilterStage:
+    """
+    Filter the frames of a FrameRingBuffer into a second FrameRingBuffer, so each consumer can get its own smoothed
+    view of the raw stream without changing the filter of the device ('filter'). The positions and the orientations
+    (as quaternions, normalized after filtering) of each hub are filtered separately; the time between two frames
+    follows from the frame numbers and the frame rate.
+
+        stage = FilterStage(engine.ring, OneEuroFilter(), frame_rate=engine.frame_rate)
+        reader = stage.ring.reader()
+        ...
+        stage.poll()
+        n = reader.read(frames)
+
+    :Attributes:
+    - filter:       the filter (see StreamFilter)
+    - frame_rate:   frame rate of the system in Hz
+    - ori_unit:     unit of the orientations of the frames
+    - reader:       consumer of the raw ring buffer
+    - ring:         buffer receiving the filtered frames
+    """
+    def __init__(self, ring, filter, frame_rate=120, ori_unit=UNITS.G4_TYPE_EULER_DEGREE, capacity=None,
+                 batch_frames=256):
+        self.filter = filter
+        self.frame_rate = frame_rate
+        self.ori_unit = ori_unit
+        self.reader = ring.reader()
+        self.ring = FrameRingBuffer(ring.capacity if capacity is None else capacity)
+        self.last_frames = {}
+        self._last_quaternions = {}
+        self._frames = (G4FrameData * batch_frames)()
+        self._timestamps = (ct.c_double * batch_frames)()
+        self._view = frames_view(self._frames)
+
+    def reset(self):
+        """
+        Forget the state of all hubs
+        """
+        self.filter.reset()
+        self.last_frames.clear()
+        self._last_quaternions.clear()
+
+    def poll(self):
+        """
+        Filter all waiting frames of the raw ring buffer
+        :return: number of filtered frames
+        :rtype: int
+        """
+        total = 0
+        while True:
+            n = self.reader.read(self._frames, self._timestamps)
+            if n == 0:
+                return total
+            view = self._view[:n]
+            active = active_sensors(view)
+            quaternions = convert_orientations(orientations(view), self.ori_unit, UNITS.G4_TYPE_QUATERNION)
+            values = np.concatenate([positions(view), quaternions], axis=-1)
+
+            for i in range(n):
+                hub, frame = int(view["hub"][i]), int(view["frame"][i])
+                last_frame = self.last_frames.get(hub)
+                dt = (frame - last_frame) / self.frame_rate if last_frame is not None else 0.0
+                self.last_frames[hub] = frame
+
+                # same hemisphere as the previous quaternion, q and -q are the same orientation
+                x = values[i]
+                last_q = self._last_quaternions.get(hub)
+                if last_q is not None:
+                    x[:, 3:] *= np.where(np.sum(x[:, 3:] * last_q, axis=-1, keepdims=True) < 0, -1, 1)
+                values[i] = self.filter.update(hub, x, dt, active[i])
+                norm = np.linalg.norm(values[i, :, 3:], axis=-1, keepdims=True)
+                values[i, :, 3:] /= np.where(norm > 0, norm, 1)
+                self._last_quaternions[hub] = values[i, :, 3:].copy()
+
+            positions(view)[:] = values[..., :3]
+            orientations(view)[:] = convert_orientations(values[..., 3:], UNITS.G4_TYPE_QUATERNION, self.ori_unit)
+            for i in range(n):
+                self.ring.write(self._frames[i], self._timestamps[i])
+            total += n
@@ -0,0 +1,271 @@
+"""
+Vectorized orientation math for arrays of any shape (..., 3) for Euler angles, (..., 4) for quaternions and
+(..., 3, 3) for rotation matrices. Euler angles are in the order of the G4 (azimuth, elevation, roll): rotations
+around z, y and x, R = Rz(azimuth) @ Ry(elevation) @ Rx(roll). Quaternions are [w, x, y, z].
+"""
+import numpy as np
+
+
+def euler_to_matrix(euler, degrees=True):
+    """
+    :param euler: Euler angles (azimuth, elevation, roll) with shape (..., 3)
+    :type euler: np.ndarray
+    :param degrees: True if the angles are in degrees, otherwise radians
+    :type degrees: bool
+    :return: rotation matrices with shape (..., 3, 3)
+    :rtype: np.ndarray
+    """
+    euler = np.asarray(euler, dtype=np.float64)
+    if degrees:
+        euler = np.radians(euler)
+    ca, cb, cc = np.cos(euler[..., 0]), np.cos(euler[..., 1]), np.cos(euler[..., 2])
+    sa, sb, sc = np.sin(euler[..., 0]), np.sin(euler[..., 1]), np.sin(euler[..., 2])
+
+    matrix = np.empty(euler.shape[:-1] + (3, 3))
+    matrix[..., 0, 0] = ca * cb
+    matrix[..., 0, 1] = ca * sb * sc - sa * cc
+    matrix[..., 0, 2] = ca * sb * cc + sa * sc
+    matrix[..., 1, 0] = sa * cb
+    matrix[..., 1, 1] = sa * sb * sc + ca * cc
+    matrix[..., 1, 2] = sa * sb * cc - ca * sc
+    matrix[..., 2, 0] = -sb
+    matrix[..., 2, 1] = cb * sc
+    matrix[..., 2, 2] = cb * cc
+    return matrix
+
+
+def matrix_to_euler(matrix, degrees=True):
+    """
+    :param matrix: rotation matrices with shape (..., 3, 3)
+    :type matrix: np.ndarray
+    :param degrees: True to return the angles in degrees, otherwise radians
+    :type degrees: bool
+    :return: Euler angles (azimuth, elevation, roll) with shape (..., 3)
+    :rtype: np.ndarray
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    euler = np.empty(matrix.shape[:-2] + (3,))
+    euler[..., 0] = np.arctan2(matrix[..., 1, 0], matrix[..., 0, 0])
+    euler[..., 1] = np.arcsin(np.clip(-matrix[..., 2, 0], -1, 1))
+    euler[..., 2] = np.arctan2(matrix[..., 2, 1], matrix[..., 2, 2])
+    return np.degrees(euler) if degrees else euler
+
+
+def quaternion_to_matrix(quaternion):
+    """
+    :param quaternion: quaternions [w, x, y, z] with shape (..., 4), normalized here
+    :type quaternion: np.ndarray
+    :return: rotation matrices with shape (..., 3, 3)
+    :rtype: np.ndarray
+    """
+    q = np.asarray(quaternion, dtype=np.float64)
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+
+    matrix = np.empty(q.shape[:-1] + (3, 3))
+    matrix[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    matrix[..., 0, 1] = 2 * (x * y - w * z)
+    matrix[..., 0, 2] = 2 * (x * z + w * y)
+    matrix[..., 1, 0] = 2 * (x * y + w * z)
+    matrix[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    matrix[..., 1, 2] = 2 * (y * z - w * x)
+    matrix[..., 2, 0] = 2 * (x * z - w * y)
+    matrix[..., 2, 1] = 2 * (y * z + w * x)
+    matrix[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    return matrix
+
+
+def matrix_to_quaternion(matrix):
+    """
+    :param matrix: rotation matrices with shape (..., 3, 3)
+    :type matrix: np.ndarray
+    :return: unit quaternions [w, x, y, z] with w >= 0 and shape (..., 4)
+    :rtype: np.ndarray
+    """
+    m = np.asarray(matrix, dtype=np.float64)
+    trace = m[..., 0, 0] + m[..., 1, 1] + m[..., 2, 2]
+
+    # magnitude of each component from the diagonal
+    q = np.empty(m.shape[:-2] + (4,))
+    q[..., 0] = np.sqrt(np.maximum(1 + trace, 0)) / 2
+    q[..., 1] = np.sqrt(np.maximum(1 + m[..., 0, 0] - m[..., 1, 1] - m[..., 2, 2], 0)) / 2
+    q[..., 2] = np.sqrt(np.maximum(1 - m[..., 0, 0] + m[..., 1, 1] - m[..., 2, 2], 0)) / 2
+    q[..., 3] = np.sqrt(np.maximum(1 - m[..., 0, 0] - m[..., 1, 1] + m[..., 2, 2], 0)) / 2
+
+    # the largest component is accurate, the others follow from it
+    largest = np.argmax(q, axis=-1)
+    zero = np.zeros_like(trace)
+    products = np.stack([
+        np.stack([zero, m[..., 2, 1] - m[..., 1, 2], m[..., 0, 2] - m[..., 2, 0],
+                  m[..., 1, 0] - m[..., 0, 1]], axis=-1),
+        np.stack([m[..., 2, 1] - m[..., 1, 2], zero, m[..., 0, 1] + m[..., 1, 0],
+                  m[..., 0, 2] + m[..., 2, 0]], axis=-1),
+        np.stack([m[..., 0, 2] - m[..., 2, 0], m[..., 0, 1] + m[..., 1, 0], zero,
+                  m[..., 1, 2] + m[..., 2, 1]], axis=-1),
+        np.stack([m[..., 1, 0] - m[..., 0, 1], m[..., 0, 2] + m[..., 2, 0], m[..., 1, 2] + m[..., 2, 1],
+                  zero], axis=-1),
+    ], axis=-2)
+    pivot = np.take_along_axis(q, largest[..., None], axis=-1)
+    result = np.take_along_axis(products, largest[..., None, None], axis=-2)[..., 0, :] / (4 * pivot)
+    np.put_along_axis(result, largest[..., None], pivot, axis=-1)
+
+    result *= np.where(result[..., :1] < 0, -1, 1)
+    return result
+
+
+def euler_to_quaternion(euler, degrees=True):
+    """
+    :param euler: Euler angles (azimuth, elevation, roll) with shape (..., 3)
+    :type euler: np.ndarray
+    :param degrees: True if the angles are in degrees, otherwise radians
+    :type degrees: bool
+    :return: unit quaternions [w, x, y, z] with shape (..., 4)
+    :rtype: np.ndarray
+    """
+    euler = np.asarray(euler, dtype=np.float64)
+    if degrees:
+        euler = np.radians(euler)
+    half = euler / 2
+    ca, cb, cc = np.cos(half[..., 0]), np.cos(half[..., 1]), np.cos(half[..., 2])
+    sa, sb, sc = np.sin(half[..., 0]), np.sin(half[..., 1]), np.sin(half[..., 2])
+
+    q = np.empty(euler.shape[:-1] + (4,))
+    q[..., 0] = ca * cb * cc + sa * sb * sc
+    q[..., 1] = ca * cb * sc - sa * sb * cc
+    q[..., 2] = ca * sb * cc + sa * cb * sc
+    q[..., 3] = sa * cb * cc - ca * sb * sc
+    return q
+
+
+def quaternion_to_euler(quaternion, degrees=True):
+    """
+    :param quaternion: quaternions [w, x, y, z] with shape (..., 4)
+    :type quaternion: np.ndarray
+    :param degrees: True to return the angles in degrees, otherwise radians
+    :type degrees: bool
+    :return: Euler angles (azimuth, elevation, roll) with shape (..., 3)
+    :rtype: np.ndarray
+    """
+    return matrix_to_euler(quaternion_to_matrix(quaternion), degrees)
+
+
+def quaternion_multiply(a, b):
+    """
+    Hamilton product a * b (the rotation b followed by the rotation a)
+    :param a: quaternions [w, x, y, z] with shape (..., 4)
+    :type a: np.ndarray
+    :param b: quaternions [w, x, y, z] with shape (..., 4), broadcast with a
+    :type b: np.ndarray
+    :return: quaternions with shape (..., 4)
+    :rtype: np.ndarray
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    aw, ax, ay, az = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+    bw, bx, by, bz = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+    return np.stack([aw * bw - ax * bx - ay * by - az * bz,
+                     aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw], axis=-1)
+
+
+def quaternion_conjugate(quaternion):
+    """
+    :param quaternion: quaternions [w, x, y, z] with shape (..., 4)
+    :type quaternion: np.ndarray
+    :return: the conjugates (the inverse rotations for unit quaternions)
+    :rtype: np.ndarray
+    """
+    return np.asarray(quaternion, dtype=np.float64) * np.array([1.0, -1.0, -1.0, -1.0])
+
+
+def quaternion_to_rotation_vector(quaternion):
+    """
+    :param quaternion: unit quaternions [w, x, y, z] with shape (..., 4)
+    :type quaternion: np.ndarray
+    :return: rotation vectors (axis * angle in radians, angle in [0, pi]) with shape (..., 3)
+    :rtype: np.ndarray
+    """
+    q = np.asarray(quaternion, dtype=np.float64)
+    q = q * np.where(q[..., :1] < 0, -1, 1)
+    sin_half = np.linalg.norm(q[..., 1:], axis=-1)
+    angle = 2 * np.arctan2(sin_half, q[..., 0])
+    # angle / sin(angle / 2) tends to 2 for small angles
+    scale = np.where(sin_half > 1e-12, angle / np.maximum(sin_half, 1e-12), 2.0)
+    return q[..., 1:] * scale[..., None]
+
+
+def rotation_vector_to_quaternion(rotation_vector):
+    """
+    :param rotation_vector: rotation vectors (axis * angle in radians) with shape (..., 3)
+    :type rotation_vector: np.ndarray
+    :return: unit quaternions [w, x, y, z] with shape (..., 4)
+    :rtype: np.ndarray
+    """
+    v = np.asarray(rotation_vector, dtype=np.float64)
+    angle = np.linalg.norm(v, axis=-1)
+    # sin(angle / 2) / angle tends to 1 / 2 for small angles
+    scale = np.where(angle > 1e-12, np.sin(angle / 2) / np.maximum(angle, 1e-12), 0.5)
+    return np.concatenate([np.cos(angle / 2)[..., None], v * scale[..., None]], axis=-1)
+
+
+def relative_orientation(reference, quaternion):
+    """
+    Orientation of a sensor in the frame of a reference sensor, conj(reference) * quaternion
+    :param reference: orientations [w, x, y, z] of the reference with shape (..., 4)
+    :type reference: np.ndarray
+    :param quaternion: orientations [w, x, y, z] of the sensor with shape (..., 4), broadcast with reference
+    :type quaternion: np.ndarray
+    :return: unit quaternions with w >= 0 and shape (..., 4)
+    :rtype: np.ndarray
+    """
+    q = quaternion_multiply(quaternion_conjugate(reference), quaternion)
+    q /= np.linalg.norm(q, axis=-1, keepdims=True)
+    return q * np.where(q[..., :1] < 0, -1, 1)
+
+
+def slerp(q0, q1, t):
+    """
+    Spherical linear interpolation along the shortest arc, q0 for t = 0 and q1 for t = 1
+    :param q0: unit quaternions [w, x, y, z] with shape (..., 4)
+    :type q0: np.ndarray
+    :param q1: unit quaternions [w, x, y, z] with shape (..., 4)
+    :type q1: np.ndarray
+    :param t: interpolation parameters with shape (...), broadcast with q0 and q1
+    :type t: np.ndarray | float
+    :return: unit quaternions with shape (..., 4)
+    :rtype: np.ndarray
+    """
+    q0 = np.asarray(q0, dtype=np.float64)
+    q1 = np.asarray(q1, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)[..., None]
+
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.clip(np.abs(dot), 0.0, 1.0)
+
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    # linear interpolation where the quaternions are almost equal
+    close = sin_theta < 1e-6
+    safe_sin = np.where(close, 1.0, sin_theta)
+    w0 = np.where(close, 1 - t, np.sin((1 - t) * theta) / safe_sin)
+    w1 = np.where(close, t, np.sin(t * theta) / safe_sin)
+    q = w0 * q0 + w1 * q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def angular_velocity(quaternion, timestamps):
+    """
+    Angular velocity between consecutive samples, in the reference frame of the orientations
+    :param quaternion: orientations [w, x, y, z] with shape (samples, ..., 4)
+    :type quaternion: np.ndarray
+    :param timestamps: time in seconds of the samples, shape (samples,)
+    :type timestamps: np.ndarray
+    :return: angular velocities in rad/s with shape (samples - 1, ..., 3)
+    :rtype: np.ndarray
+    """
+    q = np.asarray(quaternion, dtype=np.float64)
+    dt = np.diff(np.asarray(timestamps, dtype=np.float64))
+    delta = quaternion_multiply(q[1:], quaternion_conjugate(q[:-1]))
+    return quaternion_to_rotation_vector(delta) / dt.reshape((-1,) + (1,) * (q.ndim - 1))
@@ -0,0 +1,99 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.animation import FuncAnimation
+
+from G4Track import *
+from G4Arrays import ring_view, ring_indices, positions, active_sensors
+
+
+class TrajectoryPlot:
+    """
+    Real-time 3D plot of the positions of the last seconds of each sensor, read from a FrameRingBuffer. Only the
+    lines are redrawn (blitting, the axes are fixed by limits) and their data are arrays of a fixed size, so the cost
+    of a redraw does not depend on the length of the session.
+
+        plot = TrajectoryPlot(engine.ring, [hub_id], frame_rate=engine.frame_rate)
+        plot.show()
+
+    :Attributes:
+    - ring:         the ring buffer (it must hold at least seconds * frame_rate frames of each hub)
+    - hub_ids:      hubs to plot
+    - length:       number of frames per line (seconds * frame_rate)
+    - figure:       the matplotlib figure
+    - lines:        per hub and sensor the line of the trajectory, by (hub_id, sensor)
+    - heads:        per hub and sensor the marker of the last position, by (hub_id, sensor)
+    """
+    def __init__(self, ring, hub_ids, seconds=5.0, frame_rate=120, limits=((-100, 100), (-100, 100), (-100, 100))):
+        self.ring = ring
+        self.hub_ids = list(hub_ids)
+        self.length = min(int(seconds * frame_rate), ring.capacity // max(len(self.hub_ids), 1))
+        self.figure = plt.figure()
+        self.axes = self.figure.add_subplot(projection="3d")
+        self.axes.set_xlim(*limits[0])
+        self.axes.set_ylim(*limits[1])
+        self.axes.set_zlim(*limits[2])
+        self.axes.set_xlabel("x")
+        self.axes.set_ylabel("y")
+        self.axes.set_zlabel("z")
+        self.lines = {}
+        self.heads = {}
+        for hub_id in self.hub_ids:
+            for sensor in range(G4_sensors_per_hub):
+                line, = self.axes.plot([], [], [], linewidth=1, label=f"hub {hub_id}, sensor {sensor + 1}")
+                head, = self.axes.plot([], [], [], "o", markersize=4, color=line.get_color())
+                self.lines[(hub_id, sensor)] = line
+                self.heads[(hub_id, sensor)] = head
+        self.axes.legend(loc="upper left", fontsize=7)
+        self._data = np.full((len(self.hub_ids), G4_sensors_per_hub, 3, self.length), np.nan)
+        self.animation = None
+
+    def artists(self):
+        """
+        :return: all lines and markers
+        :rtype: list
+        """
+        return list(self.lines.values()) + list(self.heads.values())
+
+    def update(self, *args):
+        """
+        Copy the last frames of the ring into the lines
+        :return: the changed artists
+        :rtype: list
+        """
+        frames, timestamps = ring_view(self.ring)
+        view = frames[ring_indices(self.ring, self.length * len(self.hub_ids))]
+        pos = positions(view)
+        active = active_sensors(view)
+
+        self._data.fill(np.nan)
+        for h, hub_id in enumerate(self.hub_ids):
+            rows = np.flatnonzero(view["hub"] == hub_id)[-self.length:]
+            if len(rows) == 0:
+                continue
+            # newest frames at the end of the line, inactive sensors leave a gap
+            hub_pos = np.where(active[rows][..., None], pos[rows], np.nan)
+            self._data[h, :, :, self.length - len(rows):] = hub_pos.transpose(1, 2, 0)
+
+        for h, hub_id in enumerate(self.hub_ids):
+            for sensor in range(G4_sensors_per_hub):
+                x, y, z = self._data[h, sensor]
+                self.lines[(hub_id, sensor)].set_data_3d(x, y, z)
+                self.heads[(hub_id, sensor)].set_data_3d(x[-1:], y[-1:], z[-1:])
+        return self.artists()
+
+    def animate(self, fps=60):
+        """
+        Start redrawing the lines fps times per second
+        :return: the animation (keep a reference as long as the plot is shown)
+        :rtype: FuncAnimation
+        """
+        self.animation = FuncAnimation(self.figure, self.update, init_func=self.artists, interval=1000 / fps,
+                                       blit=True, cache_frame_data=False)
+        return self.animation
+
+    def show(self, fps=60):
+        """
+        Show the plot until its window is closed
+        """
+        self.animate(fps)
+        plt.show()
@@ -0,0 +1,146 @@
+import ctypes as ct
+
+import numpy as np
+
+from G4Track import *
+from G4Arrays import frames_view, positions, orientations, active_sensors
+from G4Orientation import quaternion_conjugate, quaternion_multiply, quaternion_to_rotation_vector, \
+    rotation_vector_to_quaternion
+from G4Transform import convert_orientations
+
+
+class PosePredictor:
+    """
+    Extrapolate the pose of each sensor to a host time, to compensate the latency between a measurement and its
+    use (e.g. the display of the next image). Per hub, the last frames of a FrameRingBuffer are kept; the velocity
+    is a least-squares fit of the positions and the angular velocity is the mean over these frames.
+
+    The measurement time of a frame follows from its frame number: the newest frame is taken as measured at its
+    host time minus latency, the older frames at 1 / frame_rate intervals before it.
+
+        predictor = PosePredictor(engine.ring, frame_rate=engine.frame_rate, latency=0.01)
+        ...
+        predictor.poll()
+        pos, ori, valid = predictor.predict(hub_id, time.perf_counter() + display_delay)
+
+    :Attributes:
+    - frame_rate:   frame rate of the system in Hz
+    - history:      number of frames used per hub
+    - latency:      time in seconds between the measurement of a frame and its host time
+    - max_horizon:  maximum extrapolation in seconds, later times give the pose at max_horizon
+    - ori_unit:     unit of the orientations of the frames and of the prediction
+    - reader:       consumer of the ring buffer
+    """
+    def __init__(self, ring, frame_rate=120, history=8, latency=0.0, max_horizon=0.1,
+                 ori_unit=UNITS.G4_TYPE_EULER_DEGREE, batch_frames=256):
+        self.frame_rate = frame_rate
+        self.history = history
+        self.latency = latency
+        self.max_horizon = max_horizon
+        self.ori_unit = ori_unit
+        self.reader = ring.reader()
+        self._hubs = {}
+        self._frames = (G4FrameData * batch_frames)()
+        self._timestamps = (ct.c_double * batch_frames)()
+        self._view = frames_view(self._frames)
+
+    def _hub(self, hub):
+        state = self._hubs.get(hub)
+        if state is None:
+            state = self._hubs[hub] = {
+                "count": 0,
+                "frame": np.zeros(self.history, dtype=np.int64),
+                "timestamp": 0.0,
+                "pos": np.zeros((self.history, G4_sensors_per_hub, 3)),
+                "quaternion": np.tile([1.0, 0.0, 0.0, 0.0], (self.history, G4_sensors_per_hub, 1)),
+                "active": np.zeros((self.history, G4_sensors_per_hub), dtype=bool)}
+        return state
+
+    def poll(self):
+        """
+        Add the waiting frames of the ring buffer to the history
+        :return: number of new frames
+        :rtype: int
+        """
+        total = 0
+        while True:
+            n = self.reader.read(self._frames, self._timestamps)
+            if n == 0:
+                return total
+            view = self._view[:n]
+            quaternions = convert_orientations(orientations(view), self.ori_unit, UNITS.G4_TYPE_QUATERNION)
+            active = active_sensors(view)
+            for i in range(n):
+                state = self._hub(int(view["hub"][i]))
+                row = state["count"] % self.history
+                state["frame"][row] = view["frame"][i]
+                state["timestamp"] = self._timestamps[i]
+                state["pos"][row] = positions(view)[i]
+                state["quaternion"][row] = quaternions[i]
+                state["active"][row] = active[i]
+                state["count"] += 1
+            total += n
+
+    def hub_ids(self):
+        """
+        :return: the hubs with at least one frame in the history
+        :rtype: list[int]
+        """
+        return sorted(self._hubs)
+
+    def predict(self, hub_id, timestamp):
+        """
+        Pose of the sensors of a hub at a host time
+        :param hub_id: hub id
+        :type hub_id: int
+        :param timestamp: host time (time.perf_counter)
+        :type timestamp: float
+        :return: positions with shape (sensors, 3), orientations in ori_unit with shape (sensors, 4) and a boolean
+            array with shape (sensors,), True for the sensors with data in the history
+        :rtype: (np.ndarray, np.ndarray, np.ndarray)
+        """
+        state = self._hubs.get(hub_id)
+        pos = np.zeros((G4_sensors_per_hub, 3))
+        quaternion = np.tile([1.0, 0.0, 0.0, 0.0], (G4_sensors_per_hub, 1))
+        if state is None:
+            return pos, convert_orientations(quaternion, UNITS.G4_TYPE_QUATERNION, self.ori_unit), \
+                np.zeros(G4_sensors_per_hub, dtype=bool)
+
+        # history oldest first, times relative to the newest measurement
+        count = min(state["count"], self.history)
+        order = (np.arange(state["count"] - count, state["count"])) % self.history
+        frames = state["frame"][order]
+        times = (frames - frames[-1]) / self.frame_rate
+        active = state["active"][order]
+        valid = active.any(axis=0)
+        horizon = min(timestamp - (state["timestamp"] - self.latency), self.max_horizon)
+
+        # positions: weighted least-squares line over the active frames
+        weights = active.astype(np.float64)
+        total = np.maximum(weights.sum(axis=0), 1)
+        mean_time = (weights * times[:, None]).sum(axis=0) / total
+        samples = state["pos"][order]
+        mean_pos = (weights[..., None] * samples).sum(axis=0) / total[:, None]
+        centered_time = (times[:, None] - mean_time) * weights
+        variance = (centered_time * (times[:, None] - mean_time)).sum(axis=0)
+        velocity = (centered_time[..., None] * (samples - mean_pos)).sum(axis=0) \
+            / np.where(variance > 0, variance, 1)[:, None]
+        pos[valid] = (mean_pos + velocity * (horizon - mean_time)[:, None])[valid]
+
+        # orientations: newest active orientation, rotated at the mean angular velocity
+        newest = count - 1 - np.argmax(active[::-1], axis=0)
+        sensors = np.arange(G4_sensors_per_hub)
+        quaternions = state["quaternion"][order]
+        if count > 1:
+            dt = np.diff(times)
+            pairs = active[1:] & active[:-1] & (dt > 0)[:, None]
+            delta = quaternion_multiply(quaternions[1:], quaternion_conjugate(quaternions[:-1]))
+            omega = quaternion_to_rotation_vector(delta) / np.where(dt > 0, dt, 1)[:, None, None]
+            omega = (omega * pairs[..., None]).sum(axis=0) / np.maximum(pairs.sum(axis=0), 1)[:, None]
+        else:
+            omega = np.zeros((G4_sensors_per_hub, 3))
+        rotation = rotation_vector_to_quaternion(omega * (horizon - times[newest])[:, None])
+        predicted = quaternion_multiply(rotation, quaternions[newest, sensors])
+        quaternion[valid] = predicted[valid]
+
+        return pos, convert_orientations(quaternion, UNITS.G4_TYPE_QUATERNION, self.ori_unit), valid
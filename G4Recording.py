@@ -0,0 +1,361 @@
+import ctypes as ct
+import os
+import threading
+
+import numpy as np
+
+from G4Track import *
+from G4Arrays import frame_dtype
+
+recording_magic = b"G4REC\x00\x00\x00"
+recording_version = 1
+
+
+class G4RecordingHeader(ct.Structure):
+    """
+    Header at the start of each recording file with fields:
+
+    :Attributes:
+    - magic:            recording_magic, to recognise the file
+    - version:          version of the file layout
+    - record_size:      size in bytes of one G4Record
+    - sensors_per_hub:  G4_sensors_per_hub of the recorded frames
+    - file_index:       number of the file in a recording split in several files
+    """
+    _fields_ = [("magic", ct.c_char * 8),
+                ("version", ct.c_uint32),
+                ("record_size", ct.c_uint32),
+                ("sensors_per_hub", ct.c_uint32),
+                ("file_index", ct.c_uint32),
+                ("reserved", ct.c_uint8 * 8)]
+
+
+class G4Record(ct.Structure):
+    """
+    Fixed-size record of a recording file with fields:
+
+    :Attributes:
+    - timestamp:    host time (time.perf_counter, monotonic) at which the frame was read
+    - fd:           the raw frame
+    """
+    _fields_ = [("timestamp", ct.c_double),
+                ("fd", G4FrameData)]
+
+
+record_dtype = np.dtype([("timestamp", np.float64),
+                         ("fd", frame_dtype)])
+
+assert record_dtype.itemsize == ct.sizeof(G4Record)
+
+
+def recording_file_name(path, file_index):
+    """
+    Name of one file of a recording, 'session.g4r' gives 'session_0000.g4r', 'session_0001.g4r', ...
+    :param path: path of the recording
+    :type path: str
+    :param file_index: number of the file
+    :type file_index: int
+    :return: path of the file
+    :rtype: str
+    """
+    base, extension = os.path.splitext(path)
+    return f"{base}_{file_index:04d}{extension or '.g4r'}"
+
+
+def recording_files(path):
+    """
+    All files of a recording, in order
+    :param path: path of the recording (as given to FrameRecorder)
+    :type path: str
+    :return: list of paths of the existing files
+    :rtype: list[str]
+    """
+    files = []
+    while os.path.exists(recording_file_name(path, len(files))):
+        files.append(recording_file_name(path, len(files)))
+    return files
+
+
+class FrameRecorder:
+    """
+    Append the frames of a FrameRingBuffer to binary files of fixed-size G4Records. The frames are collected and
+    written in batches by a writer thread, so the acquisition thread never waits for the disk. A new file is
+    started when a file would exceed max_file_size.
+
+    :Attributes:
+    - path:             path of the recording, the files are numbered (see 'recording_file_name')
+    - max_file_size:    maximum size of a file in bytes, at least the header and one record (None for a single
+                        file)
+    - interval:         seconds between two writes
+    - frames_written:   number of recorded frames
+    - file_index:       number of the current file
+    - reader:           consumer of the ring buffer, its overflows are the frames lost by the recorder
+    """
+    def __init__(self, ring, path, max_file_size=1 << 30, batch_frames=4096, interval=0.1):
+        if max_file_size is not None and max_file_size < ct.sizeof(G4RecordingHeader) + ct.sizeof(G4Record):
+            raise ValueError(f"max_file_size {max_file_size} is smaller than a file with one record "
+                             f"({ct.sizeof(G4RecordingHeader) + ct.sizeof(G4Record)} bytes)")
+        self.path = path
+        self.max_file_size = max_file_size
+        self.interval = interval
+        self.frames_written = 0
+        self.file_index = -1
+        self.reader = ring.reader()
+        self._frames = (G4FrameData * batch_frames)()
+        self._timestamps = (ct.c_double * batch_frames)()
+        self._records = np.zeros(batch_frames, dtype=record_dtype)
+        self._frames_np = np.frombuffer(self._frames, dtype=frame_dtype)
+        self._timestamps_np = np.frombuffer(self._timestamps, dtype=np.float64)
+        self._file = None
+        self._file_size = 0
+        self._stop_event = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """
+        Open the first file and start the writer thread. The files of an earlier recording with the same path are
+        deleted, otherwise its higher-numbered files would be read as part of this recording.
+        """
+        if self._thread is not None:
+            return
+        if self._file is None:
+            if self.file_index == -1:
+                for file in recording_files(self.path):
+                    os.remove(file)
+            self._open_next_file()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="G4Recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Write the remaining frames, stop the writer thread and close the file
+        """
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _open_next_file(self):
+        if self._file is not None:
+            self._file.close()
+        self.file_index += 1
+        header = G4RecordingHeader(magic=recording_magic, version=recording_version,
+                                   record_size=ct.sizeof(G4Record), sensors_per_hub=G4_sensors_per_hub,
+                                   file_index=self.file_index)
+        self._file = open(recording_file_name(self.path, self.file_index), "wb", buffering=0)
+        self._write(bytes(header))
+        self._file_size = ct.sizeof(header)
+
+    def _write(self, data):
+        # an unbuffered file can write less than asked, a partial record would shift all following records
+        data = memoryview(data).cast("B")
+        while len(data):
+            data = data[self._file.write(data):]
+
+    def write_pending(self):
+        """
+        Write all frames that are waiting in the ring buffer (called by the writer thread, or by any thread to have
+        the frames up to now in the files, e.g. before reading the recording)
+        :return: number of frames written
+        :rtype: int
+        """
+        with self._write_lock:
+            return self._write_pending()
+
+    def _write_pending(self):
+        total = 0
+        while True:
+            n = self.reader.read(self._frames, self._timestamps)
+            if n == 0:
+                return total
+            records = self._records[:n]
+            records["timestamp"] = self._timestamps_np[:n]
+            records["fd"] = self._frames_np[:n]
+
+            start = 0
+            while start < n:
+                if self.max_file_size is not None:
+                    space = (self.max_file_size - self._file_size) // record_dtype.itemsize
+                    if space <= 0:
+                        self._open_next_file()
+                        continue
+                else:
+                    space = n
+                end = min(n, start + space)
+                self._write(records[start:end])
+                self._file_size += (end - start) * record_dtype.itemsize
+                start = end
+
+            self.frames_written += n
+            total += n
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write_pending()
+        self.write_pending()
+
+
+def read_header(path):
+    """
+    Read and check the header of a recording file
+    :param path: path of the file
+    :type path: str
+    :return: the header
+    :rtype: G4RecordingHeader
+    """
+    header = G4RecordingHeader()
+    with open(path, "rb") as file:
+        file.readinto(header)
+    if header.magic != recording_magic.rstrip(b"\x00"):
+        raise ValueError(f"{path} is not a G4 recording")
+    if header.version != recording_version or header.record_size != ct.sizeof(G4Record) \
+            or header.sensors_per_hub != G4_sensors_per_hub:
+        raise ValueError(f"{path} has an unsupported layout (version {header.version}, record size "
+                         f"{header.record_size}, {header.sensors_per_hub} sensors per hub)")
+    return header
+
+
+class Recording:
+    """
+    Random access to a recording made by FrameRecorder. The files are memory-mapped, so only the parts that are
+    used are loaded in RAM. The records of each file are a zero-copy structured array with dtype record_dtype
+    (record["fd"] has the layout of G4FrameData, see G4Arrays). Searching a time is a binary search (the timestamps
+    of a recording are increasing). The frame counters of the hubs are not aligned, so the records of all hubs
+    are not ordered by frame number: searching a frame number is a binary search in the records of each hub (see
+    'hub_index', the frame numbers of one hub are increasing).
+
+    :Attributes:
+    - files:        paths of the files
+    - records:      per file, the memory-mapped records
+    - starts:       per file, the global index of its first record
+    """
+    def __init__(self, path):
+        self.files = recording_files(path) if not os.path.exists(path) else [path]
+        if not self.files:
+            raise FileNotFoundError(f"No recording found at {path}")
+        self.records = []
+        for file in self.files:
+            read_header(file)
+            # a recording that is still being written can end in a partly written record, it is left out
+            count = (os.path.getsize(file) - ct.sizeof(G4RecordingHeader)) // record_dtype.itemsize
+            if count > 0:
+                self.records.append(np.memmap(file, dtype=record_dtype, mode="r",
+                                              offset=ct.sizeof(G4RecordingHeader), shape=(count,)))
+            else:
+                self.records.append(np.zeros(0, dtype=record_dtype))
+        self.starts = np.cumsum([0] + [len(records) for records in self.records])
+
+        # index: first timestamp of each file
+        self._first_times = np.array([r["timestamp"][0] if len(r) else np.inf for r in self.records])
+        self._hub_index = None
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def __getitem__(self, item):
+        """
+        Records by global index or slice (step 1). A slice within one file is a zero-copy view, a slice over
+        several files is a copy.
+        """
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                raise ValueError("Only slices with step 1 are supported")
+            return self._range(start, stop)
+        if item < 0:
+            item += len(self)
+        file_index = np.searchsorted(self.starts, item, side="right") - 1
+        return self.records[file_index][item - self.starts[file_index]]
+
+    def _range(self, start, stop):
+        if stop <= start:
+            return np.zeros(0, dtype=record_dtype)
+        first = np.searchsorted(self.starts, start, side="right") - 1
+        last = np.searchsorted(self.starts, stop - 1, side="right") - 1
+        parts = [self.records[i][max(start - self.starts[i], 0):stop - self.starts[i]] for i in range(first, last + 1)]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _take(self, indices):
+        if len(indices) == 0:
+            return np.zeros(0, dtype=record_dtype)
+        if indices[-1] - indices[0] + 1 == len(indices):
+            return self._range(int(indices[0]), int(indices[-1]) + 1)
+        files = np.searchsorted(self.starts, indices, side="right") - 1
+        return np.concatenate([self.records[i][indices[files == i] - self.starts[i]] for i in np.unique(files)])
+
+    def hub_index(self):
+        """
+        Per hub, the global indices of its records and their frame numbers (built on the first call, it reads the
+        hub and the frame number of every record)
+        :return: the indices and the frame numbers by hub id
+        :rtype: dict[int, (np.ndarray, np.ndarray)]
+        """
+        if self._hub_index is None:
+            hubs = np.concatenate([records["fd"]["hub"] for records in self.records])
+            frames = np.concatenate([records["fd"]["frame"] for records in self.records]).astype(np.int64)
+            self._hub_index = {}
+            for hub_id in np.unique(hubs):
+                indices = np.flatnonzero(hubs == hub_id)
+                self._hub_index[int(hub_id)] = (indices, frames[indices])
+        return self._hub_index
+
+    def index_time(self, timestamp):
+        """
+        :param timestamp: host time
+        :type timestamp: float
+        :return: global index of the first record at or after timestamp
+        :rtype: int
+        """
+        file_index = max(np.searchsorted(self._first_times, timestamp, side="right") - 1, 0)
+        position = np.searchsorted(self.records[file_index]["timestamp"], timestamp, side="left")
+        return int(self.starts[file_index] + position)
+
+    def index_frame(self, frame, hub_id=None):
+        """
+        :param frame: frame number
+        :type frame: int
+        :param hub_id: hub of the record (None for any hub)
+        :type hub_id: int
+        :return: global index of the first record of the hub with this frame number or a later one (len(self) if
+            there is none)
+        :rtype: int
+        """
+        hub_index = self.hub_index()
+        hub_ids = hub_index if hub_id is None else [hub_id] if hub_id in hub_index else []
+        index = len(self)
+        for hub_id in hub_ids:
+            indices, frames = hub_index[hub_id]
+            position = np.searchsorted(frames, frame, side="left")
+            if position < len(indices):
+                index = min(index, int(indices[position]))
+        return index
+
+    def time_range(self, start_time, end_time):
+        """
+        :return: the records with start_time <= timestamp < end_time
+        :rtype: np.ndarray
+        """
+        return self._range(self.index_time(start_time), self.index_time(end_time))
+
+    def frame_range(self, start_frame, end_frame):
+        """
+        :return: the records of all hubs with start_frame <= frame < end_frame, in the order of the recording
+        :rtype: np.ndarray
+        """
+        parts = []
+        for indices, frames in self.hub_index().values():
+            first, last = np.searchsorted(frames, [start_frame, end_frame], side="left")
+            parts.append(indices[first:last])
+        return self._take(np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64))
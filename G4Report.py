@@ -0,0 +1,313 @@
+import multiprocessing
+import os
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from G4Track import *
+from G4Export import export_recording_excel
+from G4Recording import Recording
+
+report_cache_version = 1
+
+
+def recording_key(recording, width, hub_ids):
+    """
+    :return: text identifying the recording files (path, size and modification time) and the report settings
+    :rtype: str
+    """
+    files = [f"{os.path.abspath(file)}:{os.path.getsize(file)}:{os.stat(file).st_mtime_ns}"
+             for file in recording.files]
+    return f"{report_cache_version}|{width}|{list(hub_ids)}|" + "|".join(files)
+
+
+def report_cache_path(path):
+    """
+    :param path: path of the recording
+    :type path: str
+    :return: path of the file with the cached summary of the recording
+    :rtype: str
+    """
+    return os.path.splitext(path)[0] + "_report.npz"
+
+
+class SessionSummary:
+    """
+    Summary of a recording for the report, computed in one pass over the records (in chunks, the memory use does
+    not depend on the length of the recording). The time of the recording is split in width buckets (one per pixel
+    of a plot); per bucket, hub and sensor the minimum, maximum and mean position are kept, so a plot of the
+    buckets shows every peak of the data.
+
+    :Attributes:
+    - hub_ids:      hubs of the summary
+    - width:        number of time buckets
+    - start_time:   host time of the first record
+    - end_time:     host time of the last record
+    - frames:       number of frames per hub
+    - count:        number of active samples per hub, bucket and sensor, shape (hubs, width, sensors)
+    - minimum:      minimum position per hub, bucket and sensor, shape (hubs, width, sensors, 3) (NaN if no data)
+    - maximum:      maximum position, same shape as minimum
+    - total:        sum of the positions, same shape as minimum
+    - total_square: sum of the squared positions, same shape as minimum
+    - path_length:  distance travelled per hub and sensor, shape (hubs, sensors)
+    """
+    def __init__(self, hub_ids, width, start_time, end_time):
+        self.hub_ids = list(hub_ids)
+        self.width = width
+        self.start_time = start_time
+        self.end_time = end_time
+        shape = (len(self.hub_ids), width, G4_sensors_per_hub)
+        self.frames = np.zeros(len(self.hub_ids), dtype=np.int64)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.minimum = np.full(shape + (3,), np.nan)
+        self.maximum = np.full(shape + (3,), np.nan)
+        self.total = np.zeros(shape + (3,))
+        self.total_square = np.zeros(shape + (3,))
+        self.path_length = np.zeros((len(self.hub_ids), G4_sensors_per_hub))
+        self._last_pos = np.full((len(self.hub_ids), G4_sensors_per_hub, 3), np.nan)
+
+    def add(self, records):
+        """
+        Add a chunk of records (dtype record_dtype, in the order of the recording)
+        """
+        duration = max(self.end_time - self.start_time, 1e-9)
+        for h, hub_id in enumerate(self.hub_ids):
+            hub_records = records[records["fd"]["hub"] == hub_id]
+            if len(hub_records) == 0:
+                continue
+            self.frames[h] += len(hub_records)
+            fd = hub_records["fd"]
+            active = (fd["stationMap"][:, None] >> np.arange(G4_sensors_per_hub, dtype=np.uint32)) & 1 == 1
+            pos = np.where(active[..., None], fd["G4_sensor_per_hub"]["pos"], np.nan).astype(np.float64)
+
+            # the records are in time order, so are the buckets: reduce each run of equal buckets at once
+            buckets = np.clip(((hub_records["timestamp"] - self.start_time) / duration * self.width).astype(np.int64),
+                              0, self.width - 1)
+            starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            b = buckets[starts]
+            self.count[h, b] += np.add.reduceat(active, starts).astype(np.int64)
+            self.minimum[h, b] = np.fmin(self.minimum[h, b], np.fmin.reduceat(pos, starts))
+            self.maximum[h, b] = np.fmax(self.maximum[h, b], np.fmax.reduceat(pos, starts))
+            known = np.nan_to_num(pos)
+            self.total[h, b] += np.add.reduceat(known, starts)
+            self.total_square[h, b] += np.add.reduceat(known ** 2, starts)
+
+            # distance between consecutive active samples of each sensor, also over the chunks
+            for sensor in range(G4_sensors_per_hub):
+                samples = pos[active[:, sensor], sensor]
+                if len(samples) == 0:
+                    continue
+                samples = np.concatenate([self._last_pos[h, sensor][None], samples])
+                steps = np.linalg.norm(np.diff(samples, axis=0), axis=-1)
+                self.path_length[h, sensor] += np.nansum(steps)
+                self._last_pos[h, sensor] = samples[-1]
+
+    def bucket_times(self):
+        """
+        :return: time of the middle of each bucket, in seconds from the start of the recording
+        :rtype: np.ndarray
+        """
+        return (np.arange(self.width) + 0.5) * (self.end_time - self.start_time) / self.width
+
+    def mean_positions(self):
+        """
+        :return: mean position per hub, bucket and sensor (NaN if no data)
+        :rtype: np.ndarray
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.total / self.count[..., None]
+
+    def statistics(self):
+        """
+        Statistics of the positions over the whole recording
+        :return: per statistic ('samples', 'mean', 'std', 'min', 'max', 'path_length') an array with shape
+            (hubs, sensors) or (hubs, sensors, 3)
+        :rtype: dict[str, np.ndarray]
+        """
+        samples = self.count.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.total.sum(axis=1) / samples[..., None]
+            variance = self.total_square.sum(axis=1) / samples[..., None] - mean ** 2
+        return {"samples": samples,
+                "mean": mean,
+                "std": np.sqrt(np.maximum(variance, 0)),
+                "min": np.nanmin(np.where(np.isnan(self.minimum), np.inf, self.minimum), axis=1),
+                "max": np.nanmax(np.where(np.isnan(self.maximum), -np.inf, self.maximum), axis=1),
+                "path_length": self.path_length}
+
+    def save(self, path, key):
+        np.savez(path, key=key, hub_ids=self.hub_ids, width=self.width, start_time=self.start_time,
+                 end_time=self.end_time, frames=self.frames, count=self.count, minimum=self.minimum,
+                 maximum=self.maximum, total=self.total, total_square=self.total_square,
+                 path_length=self.path_length)
+
+    @classmethod
+    def load(cls, path, key):
+        """
+        :return: the cached summary, None if there is none or it is for another recording or other settings
+        :rtype: SessionSummary
+        """
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if str(data["key"]) != key:
+                return None
+            summary = cls(data["hub_ids"].tolist(), int(data["width"]), float(data["start_time"]),
+                          float(data["end_time"]))
+            for name in ("frames", "count", "minimum", "maximum", "total", "total_square", "path_length"):
+                setattr(summary, name, data[name])
+        return summary
+
+
+def summarize_recording(path, hub_ids=None, width=1000, chunk_records=1 << 18, use_cache=True):
+    """
+    Summary of a recording, from the cache next to the recording when it is up to date
+    :param path: path of the recording
+    :type path: str
+    :param hub_ids: hubs to summarize (None for all hubs in the recording)
+    :type hub_ids: list[int]
+    :param width: number of time buckets
+    :type width: int
+    :param chunk_records: number of records read at once
+    :type chunk_records: int
+    :param use_cache: False to always read the recording again
+    :type use_cache: bool
+    :return: the summary
+    :rtype: SessionSummary
+    """
+    recording = Recording(path)
+    if hub_ids is None:
+        hubs = set()
+        for records in recording.records:
+            hubs.update(np.unique(records["fd"]["hub"]).tolist())
+        hub_ids = sorted(hubs)
+    key = recording_key(recording, width, hub_ids)
+    cache_path = report_cache_path(path)
+    if use_cache:
+        summary = SessionSummary.load(cache_path, key)
+        if summary is not None:
+            return summary
+
+    start_time, end_time = (recording[0]["timestamp"], recording[-1]["timestamp"]) if len(recording) else (0, 0)
+    summary = SessionSummary(hub_ids, width, start_time, end_time)
+    for start in range(0, len(recording), chunk_records):
+        summary.add(recording[start:start + chunk_records])
+    summary.save(cache_path, key)
+    return summary
+
+
+def build_report(path, pdf_path, comments="", hub_ids=None, width=1000, title="G4 session report"):
+    """
+    Write a PDF report of a recording: a page with the comments and the statistics of each sensor, and per hub a
+    page with the positions over time (minimum to maximum per bucket) and seen from above. The summary of the
+    recording is cached, so a new report with other comments only draws the pages again.
+    :param path: path of the recording
+    :type path: str
+    :param pdf_path: path of the PDF file
+    :type pdf_path: str
+    :param comments: text for the first page
+    :type comments: str
+    :param hub_ids: hubs in the report (None for all hubs in the recording)
+    :type hub_ids: list[int]
+    :param width: number of time buckets of the plots
+    :type width: int
+    :param title: title of the report
+    :type title: str
+    :return: pdf_path
+    :rtype: str
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    summary = summarize_recording(path, hub_ids, width)
+    statistics = summary.statistics()
+    times = summary.bucket_times()
+    mean = summary.mean_positions()
+
+    with PdfPages(pdf_path) as pdf:
+        figure = plt.figure(figsize=(8.27, 11.69))
+        figure.text(0.08, 0.95, title, fontsize=16, weight="bold")
+        figure.text(0.08, 0.92, f"{os.path.basename(path)}, {summary.end_time - summary.start_time:.1f} s, "
+                                f"frames per hub: {', '.join(map(str, summary.frames))}", fontsize=9)
+        figure.text(0.08, 0.88, "\n".join(textwrap.wrap(comments or "No comments.", 95)), fontsize=9, va="top")
+
+        rows = []
+        for h, hub_id in enumerate(summary.hub_ids):
+            for sensor in range(G4_sensors_per_hub):
+                if statistics["samples"][h, sensor] == 0:
+                    continue
+                rows.append([hub_id, sensor, statistics["samples"][h, sensor],
+                             *(f"{value:.2f}" for value in statistics["mean"][h, sensor]),
+                             *(f"{value:.2f}" for value in statistics["std"][h, sensor]),
+                             f"{statistics['path_length'][h, sensor]:.1f}"])
+        if rows:
+            axes = figure.add_axes([0.05, 0.05, 0.9, 0.55])
+            axes.axis("off")
+            table = axes.table(cellText=rows, loc="upper center",
+                               colLabels=["hub", "sensor", "samples", "mean x", "mean y", "mean z",
+                                          "std x", "std y", "std z", "path"])
+            table.auto_set_font_size(False)
+            table.set_fontsize(7)
+        pdf.savefig(figure)
+        plt.close(figure)
+
+        for h, hub_id in enumerate(summary.hub_ids):
+            figure, axes = plt.subplots(4, 1, figsize=(8.27, 11.69))
+            figure.suptitle(f"Hub {hub_id}")
+            for sensor in range(G4_sensors_per_hub):
+                if statistics["samples"][h, sensor] == 0:
+                    continue
+                for axis in range(3):
+                    lines = axes[axis].fill_between(times, summary.minimum[h, :, sensor, axis],
+                                                    summary.maximum[h, :, sensor, axis], alpha=0.4, linewidth=0.5,
+                                                    label=f"sensor {sensor}")
+                    axes[axis].plot(times, mean[h, :, sensor, axis], linewidth=0.5, color=lines.get_facecolor()[0])
+                axes[3].plot(mean[h, :, sensor, 0], mean[h, :, sensor, 1], linewidth=0.5, label=f"sensor {sensor}")
+            for axis, name in enumerate("xyz"):
+                axes[axis].set_ylabel(name)
+            axes[2].set_xlabel("time (s)")
+            axes[3].set_xlabel("x")
+            axes[3].set_ylabel("y")
+            axes[3].set_aspect("equal", adjustable="datalim")
+            axes[0].legend(loc="upper right", fontsize=7)
+            figure.tight_layout()
+            pdf.savefig(figure)
+            plt.close(figure)
+    return pdf_path
+
+
+class ReportBuilder:
+    """
+    Build reports in a worker process, so the caller (e.g. the Kivy UI thread) is never blocked: 'submit' returns at
+    once with a future. The process is started with 'spawn', it does not inherit the state of the caller.
+
+    :Attributes:
+    - executor:     the worker process
+    """
+    def __init__(self, max_workers=1):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, path, pdf_path, comments="", hub_ids=None, width=1000):
+        """
+        Start building a report (see 'build_report')
+        :return: future with the path of the PDF file as result
+        :rtype: concurrent.futures.Future
+        """
+        return self.executor.submit(build_report, path, pdf_path, comments, hub_ids, width)
+
+    def submit_excel(self, path, excel_path, step=None):
+        """
+        Start exporting a recording to Excel (see 'export_recording_excel')
+        :return: future with the number of rows as result (None on error)
+        :rtype: concurrent.futures.Future
+        """
+        return self.executor.submit(export_recording_excel, path, excel_path, step)
+
+    def close(self):
+        """
+        Stop the worker process after the reports that are being built
+        """
+        self.executor.shutdown(wait=False)
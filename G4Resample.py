@@ -0,0 +1,136 @@
+import ctypes as ct
+
+import numpy as np
+
+from G4Track import *
+from G4Arrays import frames_view, positions, orientations, active_sensors
+from G4Clock import ClockModel
+from G4Orientation import slerp
+from G4Transform import convert_orientations
+
+
+class Resampler:
+    """
+    Resample the frames of a FrameRingBuffer onto one uniform clock for all hubs: positions are interpolated
+    linearly and orientations with slerp between the two frames around each time of the clock. The time of a frame
+    follows from its frame number with a ClockModel per hub, without the jitter of the host time at which it was
+    read.
+
+    A time of the clock is only produced once every hub has a frame after it, or when it is older than max_delay
+    compared to the newest frame (the hubs that are late get no valid data for it).
+
+    :Attributes:
+    - hub_ids:      hubs of the output, in this order
+    - rate:         rate of the uniform clock in Hz
+    - frame_rate:   frame rate of the system in Hz
+    - max_delay:    maximum time in seconds to wait for a late hub
+    - ori_unit:     unit of the orientations of the frames and of the output
+    - next_time:    next time of the clock to produce (None before the first frame)
+    - clocks:       clock model of each hub
+    - reader:       consumer of the ring buffer
+    """
+    def __init__(self, ring, hub_ids, rate=None, frame_rate=120, max_delay=0.1, ori_unit=UNITS.G4_TYPE_EULER_DEGREE,
+                 batch_frames=1024):
+        self.hub_ids = list(hub_ids)
+        self.rate = frame_rate if rate is None else rate
+        self.frame_rate = frame_rate
+        self.max_delay = max_delay
+        self.ori_unit = ori_unit
+        self.next_time = None
+        self.reader = ring.reader()
+        self.clocks = {hub_id: ClockModel(frame_rate) for hub_id in self.hub_ids}
+        self._pending = {hub_id: None for hub_id in self.hub_ids}
+        self._frames = (G4FrameData * batch_frames)()
+        self._timestamps = (ct.c_double * batch_frames)()
+        self._view = frames_view(self._frames)
+
+    def frame_times(self, hub_id, frames, timestamps):
+        """
+        Host times of frames of one hub, from their frame numbers
+        :param hub_id: hub id
+        :type hub_id: int
+        :param frames: frame numbers
+        :type frames: np.ndarray
+        :param timestamps: host times at which the frames were read
+        :type timestamps: np.ndarray
+        :return: the host times of the frames
+        :rtype: np.ndarray
+        """
+        return self.clocks[hub_id].update(frames, timestamps)
+
+    def _add(self, view, timestamps):
+        quaternions = convert_orientations(orientations(view), self.ori_unit, UNITS.G4_TYPE_QUATERNION)
+        active = active_sensors(view)
+        for hub_id in self.hub_ids:
+            rows = np.flatnonzero(view["hub"] == hub_id)
+            if len(rows) == 0:
+                continue
+            frames = view["frame"][rows].astype(np.int64)
+            new = {"time": self.frame_times(hub_id, frames, timestamps[rows]),
+                   "pos": positions(view)[rows].astype(np.float64),
+                   "quaternion": quaternions[rows],
+                   "active": active[rows]}
+            pending = self._pending[hub_id]
+            if pending is not None:
+                new = {name: np.concatenate([pending[name], value]) for name, value in new.items()}
+            self._pending[hub_id] = new
+
+    def poll(self):
+        """
+        Resample the waiting frames of the ring buffer
+        :return: the times of the clock with shape (times,), positions with shape (times, hubs, sensors, 3),
+            orientations in ori_unit with shape (times, hubs, sensors, 4) and a boolean array with shape
+            (times, hubs, sensors), True where the sensor is active in both frames around the time
+        :rtype: (np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+        """
+        while True:
+            n = self.reader.read(self._frames, self._timestamps)
+            if n == 0:
+                break
+            self._add(self._view[:n], np.frombuffer(self._timestamps, dtype=np.float64)[:n].copy())
+
+        last_times = [pending["time"][-1] for pending in self._pending.values() if pending is not None]
+        if not last_times:
+            return self._empty()
+        period = 1 / self.rate
+        if self.next_time is None:
+            first_time = min(pending["time"][0] for pending in self._pending.values() if pending is not None)
+            self.next_time = np.ceil(first_time / period) * period
+        end_time = max(min(last_times) if len(last_times) == len(self.hub_ids) else -np.inf,
+                       max(last_times) - self.max_delay)
+        count = int(np.floor((end_time - self.next_time) / period)) + 1
+        if count <= 0:
+            return self._empty()
+        times = self.next_time + np.arange(count) * period
+        self.next_time = times[-1] + period
+
+        shape = (count, len(self.hub_ids), G4_sensors_per_hub)
+        pos = np.zeros(shape + (3,))
+        quaternion = np.zeros(shape + (4,))
+        quaternion[..., 0] = 1
+        valid = np.zeros(shape, dtype=bool)
+        for h, hub_id in enumerate(self.hub_ids):
+            pending = self._pending[hub_id]
+            if pending is None or len(pending["time"]) < 2:
+                # a hub that stopped sending keeps only its last frame, there is nothing to interpolate
+                continue
+            after = np.searchsorted(pending["time"], times, side="right")
+            inside = (after > 0) & (after < len(pending["time"]))
+            after = np.clip(after, 1, max(len(pending["time"]) - 1, 1))
+            before = after - 1
+            t0, t1 = pending["time"][before], pending["time"][after]
+            fraction = np.clip((times - t0) / np.where(t1 > t0, t1 - t0, 1), 0, 1)[:, None]
+
+            pos[:, h] = pending["pos"][before] + fraction[..., None] * (pending["pos"][after] - pending["pos"][before])
+            quaternion[:, h] = slerp(pending["quaternion"][before], pending["quaternion"][after], fraction)
+            valid[:, h] = inside[:, None] & pending["active"][before] & pending["active"][after]
+
+            # keep the frame before the next time of the clock and the frames after it
+            keep = max(np.searchsorted(pending["time"], self.next_time, side="right") - 1, 0)
+            self._pending[hub_id] = {name: value[keep:] for name, value in pending.items()}
+
+        return times, pos, convert_orientations(quaternion, UNITS.G4_TYPE_QUATERNION, self.ori_unit), valid
+
+    def _empty(self):
+        shape = (0, len(self.hub_ids), G4_sensors_per_hub)
+        return np.zeros(0), np.zeros(shape + (3,)), np.zeros(shape + (4,)), np.zeros(shape, dtype=bool)
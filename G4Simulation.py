@@ -0,0 +1,575 @@
+import ctypes as ct
+import time
+
+import numpy as np
+
+from G4Track import *
+from G4Arrays import frame_dtype
+from G4Orientation import euler_to_matrix, matrix_to_euler, matrix_to_quaternion
+from G4Recording import G4Record, Recording
+from G4Transform import unit_cm
+
+default_filter = [0.2, 0.2, 0.8, 0.95]
+
+# commands that address a hub (the other commands address a whole system, with the id create_id(sys_id, 0, 0))
+hub_commands = (COMMANDS.G4_CMD_GET_STATION_MAP.value, COMMANDS.G4_CMD_UNITS.value, COMMANDS.G4_CMD_FILTER.value,
+                COMMANDS.G4_CMD_INCREMENT.value, COMMANDS.G4_CMD_TIP_OFFSET.value, COMMANDS.G4_CMD_BORESIGHT.value,
+                COMMANDS.G4_CMD_BLOCK_CFG.value)
+
+
+def _status(error):
+    """
+    Convert an ERROR to the unsigned status returned by the G4Track library
+    :param error: error to return
+    :type error: ERROR
+    :return: the status as uint32
+    :rtype: int
+    """
+    return error.value & 0xFFFFFFFF
+
+
+def circle_trajectory(radius=10.0, period=1.0, height=0.0):
+    """
+    Motion of the simulated sensors: every sensor moves on a horizontal circle (each hub and sensor with another
+    phase and offset) and turns in azimuth with the motion
+    :param radius: radius of the circle in cm
+    :type radius: float
+    :param period: seconds per turn
+    :type period: float
+    :param height: z of the circle in cm
+    :type height: float
+    :return: trajectory function, see SimulatedG4Track
+    """
+    def trajectory(t, hub_ids, sensors):
+        phase = 2 * np.pi * t / period + 0.5 * np.asarray(hub_ids, dtype=np.float64)[:, None] \
+            + 0.25 * np.arange(sensors)
+        pos = np.stack([radius * np.cos(phase) + 5 * np.arange(sensors),
+                        radius * np.sin(phase),
+                        np.full(phase.shape, height)], axis=-1)
+        euler = np.stack([(np.degrees(phase) + 180) % 360 - 180,
+                          np.zeros(phase.shape),
+                          np.zeros(phase.shape)], axis=-1)
+        return pos, euler
+    return trajectory
+
+
+def static_trajectory(pos=(0.0, 0.0, 0.0), euler=(0.0, 0.0, 0.0)):
+    """
+    All simulated sensors at the same fixed position and orientation
+    :param pos: position in cm
+    :type pos: tuple[float, float, float]
+    :param euler: orientation (azimuth, elevation, roll) in degrees
+    :type euler: tuple[float, float, float]
+    :return: trajectory function, see SimulatedG4Track
+    """
+    def trajectory(t, hub_ids, sensors):
+        shape = (len(hub_ids), sensors, 3)
+        return np.broadcast_to(np.asarray(pos, dtype=np.float64), shape), \
+            np.broadcast_to(np.asarray(euler, dtype=np.float64), shape)
+    return trajectory
+
+
+class SimulatedSystem:
+    """
+    Configuration of one simulated system, as set with g4_set_query
+
+    :Attributes:
+    - units:            unit of the position and of the orientation, per DATATYPE value
+    - rotation:         frame of reference rotation (azimuth, elevation, roll) in degrees
+    - translation:      frame of reference translation in cm
+    - boresight:        per hub and sensor, rotation applied to the sensor orientation (identity if not set)
+    - boresight_angles: per hub and sensor, the reference angles of the boresight in degrees
+    - boresight_active: True if a sensor has a boresight
+    - tip_offsets:      per hub and sensor, offset in cm in the frame of the sensor
+    - increments:       per hub and sensor, the position and orientation increment (only stored)
+    - filters:          per hub and DATATYPE value, the 4 filter coefficients (only stored)
+    """
+    def __init__(self, hubs, sensors):
+        self.units = {DATATYPE.G4_DATA_POS.value: UNITS.G4_TYPE_CM.value,
+                      DATATYPE.G4_DATA_ORI.value: UNITS.G4_TYPE_EULER_DEGREE.value}
+        self.rotation = np.zeros(3)
+        self.translation = np.zeros(3)
+        self.boresight = np.tile(np.eye(3), (hubs, sensors, 1, 1))
+        self.boresight_angles = np.zeros((hubs, sensors, 3))
+        self.boresight_active = False
+        self.tip_offsets = np.zeros((hubs, sensors, 3))
+        self.increments = np.zeros((hubs, sensors, 2))
+        self.filters = {}
+
+
+class SimulatedG4Track:
+    """
+    Pure-Python stand-in for G4Track.dll, to be given to 'use_backend'. It simulates several systems (one per
+    g4_init_sys call), each with the same hubs, with sensors following a trajectory with noise and dropouts. The
+    frame number follows the frame rate on the host clock. The units, boresight, frame of reference and tip offset
+    commands are applied to the data, the other commands are answered.
+
+    A trajectory is a function (t, hub_ids, sensors) -> (pos, euler) giving, for a time t in seconds, the position
+    in cm and the orientation in degrees of all sensors of the given hubs, both with shape (hubs, sensors, 3).
+
+    :Attributes:
+    - hub_ids:              ids of the simulated hubs
+    - frame_rate:           frames per second of the simulated systems
+    - dongle_id:            system id returned by the first g4_init_sys (the next systems have the next ids)
+    - clock:                function returning the host time in seconds
+    - num_systems:          number of systems that can be initialized
+    - sensors:              number of sensors per hub (at most G4_sensors_per_hub)
+    - trajectory:           motion of the sensors (default: circle_trajectory())
+    - position_noise:       standard deviation of the position noise in cm
+    - orientation_noise:    standard deviation of the orientation noise in degrees
+    - hub_dropout:          probability that a hub has no data in a frame
+    - sensor_dropout:       probability that a sensor is not active in a frame
+    - systems:              the initialized systems by system id
+    """
+    def __init__(self, hub_ids=(0,), frame_rate=120, dongle_id=1, clock=time.perf_counter, num_systems=1,
+                 sensors=G4_sensors_per_hub, trajectory=None, position_noise=0.0, orientation_noise=0.0,
+                 hub_dropout=0.0, sensor_dropout=0.0, seed=None):
+        self.hub_ids = list(hub_ids)
+        self.frame_rate = frame_rate
+        self.dongle_id = dongle_id
+        self.clock = clock
+        self.num_systems = num_systems
+        self.sensors = min(sensors, G4_sensors_per_hub)
+        self.trajectory = circle_trajectory() if trajectory is None else trajectory
+        self.position_noise = position_noise
+        self.orientation_noise = orientation_noise
+        self.hub_dropout = hub_dropout
+        self.sensor_dropout = sensor_dropout
+        self.rng = np.random.default_rng(seed)
+        self.systems = {}
+        self.start_time = None
+        self._hub_rows = {hub_id: i for i, hub_id in enumerate(self.hub_ids)}
+        self._array_types = {}
+
+    def current_frame(self):
+        """
+        Get the frame number of the simulated systems
+        :return: the frame number (0 before g4_init_sys)
+        :rtype: int
+        """
+        if self.start_time is None:
+            return 0
+        return int((self.clock() - self.start_time) * self.frame_rate)
+
+    def sensor_pose(self, hub_ids, frame):
+        """
+        Position and rotation matrix of the sensors before the configuration of the system is applied
+        :param hub_ids: hubs
+        :type hub_ids: list[int]
+        :param frame: frame number
+        :type frame: int
+        :return: the positions in cm (hubs, sensors, 3) and the rotation matrices (hubs, sensors, 3, 3)
+        :rtype: (np.ndarray, np.ndarray)
+        """
+        pos, euler = self.trajectory(frame / self.frame_rate, hub_ids, self.sensors)
+        if self.position_noise:
+            pos = pos + self.rng.normal(0, self.position_noise, pos.shape)
+        if self.orientation_noise:
+            euler = euler + self.rng.normal(0, self.orientation_noise, euler.shape)
+        return pos, euler_to_matrix(euler)
+
+    def system_pose(self, system, hub_ids, frame):
+        """
+        Position and orientation of the sensors as reported by a system (boresight, tip offset, frame of reference
+        and units applied)
+        :param system: the system
+        :type system: SimulatedSystem
+        :param hub_ids: hubs
+        :type hub_ids: list[int]
+        :param frame: frame number
+        :type frame: int
+        :return: the positions (hubs, sensors, 3) and orientations (hubs, sensors, 4)
+        :rtype: (np.ndarray, np.ndarray)
+        """
+        rows = [self._hub_rows[hub_id] for hub_id in hub_ids]
+        pos, rotation = self.sensor_pose(hub_ids, frame)
+        # the configuration is applied only when it is set (the defaults have no effect)
+        if system.tip_offsets.any():
+            pos = pos + np.einsum("hsij,hsj->hsi", rotation, system.tip_offsets[rows])
+        if system.boresight_active:
+            rotation = rotation @ system.boresight[rows]
+        if system.translation.any():
+            pos = pos - system.translation
+        if system.rotation.any():
+            reference = euler_to_matrix(system.rotation)
+            pos = pos @ reference
+            rotation = reference.T @ rotation
+
+        pos = pos / unit_cm[system.units[DATATYPE.G4_DATA_POS.value]]
+        ori = np.zeros(pos.shape[:-1] + (4,))
+        ori_unit = system.units[DATATYPE.G4_DATA_ORI.value]
+        if ori_unit == UNITS.G4_TYPE_QUATERNION.value:
+            ori[:] = matrix_to_quaternion(rotation)
+        else:
+            ori[..., :3] = matrix_to_euler(rotation, degrees=ori_unit == UNITS.G4_TYPE_EULER_DEGREE.value)
+        return pos, ori
+
+    def fill_frames(self, system, view, rows, hub_ids, frame):
+        """
+        Fill frames with the simulated data of some hubs
+        :param system: the system
+        :type system: SimulatedSystem
+        :param view: structured array (frame_dtype) over the frames of g4_get_frame_data
+        :type view: np.ndarray
+        :param rows: index in view of each hub
+        :type rows: list[int]
+        :param hub_ids: hubs
+        :type hub_ids: list[int]
+        :param frame: frame number
+        :type frame: int
+        """
+        pos, ori = self.system_pose(system, hub_ids, frame)
+        active = np.ones((len(hub_ids), self.sensors), dtype=bool)
+        if self.sensor_dropout:
+            active = self.rng.random(active.shape) >= self.sensor_dropout
+        pos[~active] = 0
+        ori[~active] = 0
+
+        sensors = view["G4_sensor_per_hub"]
+        view["hub"][rows] = hub_ids
+        view["frame"][rows] = frame
+        view["stationMap"][rows] = active @ (1 << np.arange(self.sensors))
+        view["dig_io"][rows] = 0
+        sensors["id"][rows] = np.arange(G4_sensors_per_hub)
+        sensors["pos"][rows, :self.sensors] = pos
+        sensors["ori"][rows, :self.sensors] = ori
+
+    def _frames_view(self, fd_array, num_hubs):
+        array_type = self._array_types.get(num_hubs)
+        if array_type is None:
+            array_type = self._array_types[num_hubs] = G4FrameData * num_hubs
+        address = ct.cast(fd_array, ct.c_void_p).value
+        return np.frombuffer(array_type.from_address(address), dtype=frame_dtype)
+
+    def g4_init_sys(self, dongle_id, src_cfg_file, reserved):
+        if len(self.systems) >= self.num_systems:
+            return _status(ERROR.G4_ERROR_NO_CONNECTION)
+        system_id = self.dongle_id + len(self.systems)
+        self.systems[system_id] = SimulatedSystem(len(self.hub_ids), self.sensors)
+        ct.cast(dongle_id, ct.POINTER(ct.c_int))[0] = system_id
+        if self.start_time is None:
+            self.start_time = self.clock()
+        return _status(ERROR.G4_ERROR_NONE)
+
+    def g4_close_tracker(self):
+        self.systems = {}
+        self.start_time = None
+
+    def g4_get_frame_data(self, fd_array, sys_id, hub_id_list, num_hubs):
+        sys_id = getattr(sys_id, "value", sys_id)
+        num_hubs = getattr(num_hubs, "value", num_hubs)
+        system = self.systems.get(sys_id)
+        if system is None:
+            return 0
+
+        hubs = ct.cast(hub_id_list, ct.POINTER(ct.c_int))
+        rows = []
+        hub_ids = []
+        for i in range(num_hubs):
+            if hubs[i] in self._hub_rows and (not self.hub_dropout or self.rng.random() >= self.hub_dropout):
+                rows.append(i)
+                hub_ids.append(hubs[i])
+
+        if rows:
+            self.fill_frames(system, self._frames_view(fd_array, num_hubs), rows, hub_ids, self.current_frame())
+
+        return (len(self.hub_ids) << 16) | len(rows)
+
+    def _targets(self, cds, hub_command=True):
+        """
+        Systems, hub rows and sensors addressed by the id of a command (see create_id and create_id_sensormap). The
+        hub of a system command is not checked, it addresses all hubs.
+        :return: list of (system, hub rows, sensors), None if the id is not valid
+        """
+        if cds.id == -1:
+            return [(system, list(range(len(self.hub_ids))), list(range(self.sensors)))
+                    for system in self.systems.values()]
+
+        system = self.systems.get((cds.id >> 24) & 0xff)
+        hub_id = (cds.id >> 8) & 0xfff
+        if system is None or (hub_command and hub_id not in self._hub_rows):
+            return None
+        if cds.id & 0x80:
+            sensors = [i for i in range(self.sensors) if cds.id >> i & 1]
+        else:
+            sensors = [cds.id & 0x7f]
+        rows = [self._hub_rows[hub_id]] if hub_command else list(range(len(self.hub_ids)))
+        return [(system, rows, sensors)]
+
+    def g4_set_query(self, pcs):
+        cmd_struct = ct.cast(pcs, ct.POINTER(G4CMDStruct))[0]
+        cds = cmd_struct.cds
+        cmd = cmd_struct.cmd
+        action = cds.action
+
+        if cmd == COMMANDS.G4_CMD_GETMAXSRC.value:
+            cds.iParam = 1
+            return _status(ERROR.G4_ERROR_NONE)
+        if cmd == COMMANDS.G4_CMD_WHOAMI.value:
+            info = ct.cast(cds.pParam, ct.POINTER(G4SystemInfo))[0]
+            info.G4TrackVer = b"SimulatedG4Track"
+            return _status(ERROR.G4_ERROR_NONE)
+
+        # the units are set for the whole system, but read per hub
+        hub_command = cmd in hub_commands and not (cmd == COMMANDS.G4_CMD_UNITS.value
+                                                   and action == ACTION.G4_ACTION_SET.value)
+        targets = self._targets(cds, hub_command)
+        if targets is None:
+            return _status(ERROR.G4_ERROR_INVALID_SYSTEM_ID)
+        if not targets:
+            return _status(ERROR.G4_ERROR_NO_CONNECTION)
+        system, rows, sensors = targets[0]
+
+        if cmd == COMMANDS.G4_CMD_GET_ACTIVE_HUBS.value:
+            if cds.pParam:
+                hub_ids = ct.cast(cds.pParam, ct.POINTER(ct.c_int))
+                for i, hub_id in enumerate(self.hub_ids):
+                    hub_ids[i] = hub_id
+            cds.iParam = len(self.hub_ids)
+        elif cmd == COMMANDS.G4_CMD_GET_STATION_MAP.value:
+            cds.iParam = (1 << self.sensors) - 1
+        elif cmd == COMMANDS.G4_CMD_GET_SOURCE_MAP.value:
+            if cds.pParam:
+                ct.memset(cds.pParam, 0, ct.sizeof(G4SRCMAP))
+            cds.iParam = 1
+        elif cmd == COMMANDS.G4_CMD_FRAMERATE.value:
+            if action == ACTION.G4_ACTION_GET.value:
+                cds.iParam = self.frame_rate
+            else:
+                return _status(ERROR.G4_ERROR_FRAMERATE_SET)
+        elif cmd == COMMANDS.G4_CMD_UNITS.value:
+            unit = ct.cast(cds.pParam, ct.POINTER(ct.c_int))
+            if action == ACTION.G4_ACTION_SET.value:
+                for system, _, _ in targets:
+                    system.units[cds.iParam] = unit[0]
+            else:
+                unit[0] = system.units[cds.iParam]
+        elif cmd == COMMANDS.G4_CMD_FOR_ROTATE.value:
+            degrees = cds.iParam != UNITS.G4_TYPE_EULER_RADIAN.value
+            self._vector_command(cds, targets, "rotation", 3, 1 if degrees else 180 / np.pi, np.zeros(3))
+        elif cmd == COMMANDS.G4_CMD_FOR_TRANSLATE.value:
+            self._vector_command(cds, targets, "translation", 3, unit_cm.get(cds.iParam, 1.0), np.zeros(3))
+        elif cmd == COMMANDS.G4_CMD_TIP_OFFSET.value:
+            self._sensor_command(cds, targets, "tip_offsets", 3, unit_cm.get(cds.iParam & 0xFFFF, 1.0))
+        elif cmd == COMMANDS.G4_CMD_INCREMENT.value:
+            self._sensor_command(cds, targets, "increments", 2, 1.0)
+        elif cmd == COMMANDS.G4_CMD_BORESIGHT.value:
+            degrees = cds.iParam != UNITS.G4_TYPE_EULER_RADIAN.value
+            if action == ACTION.G4_ACTION_SET.value:
+                angles = np.array(ct.cast(cds.pParam, ct.POINTER(ct.c_float * 3))[0])
+                if not degrees:
+                    angles = np.degrees(angles)
+                for system, rows, sensors in targets:
+                    self._boresight(system, rows, sensors, angles)
+            elif action == ACTION.G4_ACTION_GET.value:
+                angles = system.boresight_angles[rows[0], sensors[0]]
+                ct.cast(cds.pParam, ct.POINTER(ct.c_float * 3))[0][:] = angles if degrees else np.radians(angles)
+            else:
+                for system, rows, sensors in targets:
+                    system.boresight[np.ix_(rows, sensors)] = np.eye(3)
+                    system.boresight_angles[np.ix_(rows, sensors)] = 0
+                    system.boresight_active = bool((system.boresight != np.eye(3)).any())
+        elif cmd == COMMANDS.G4_CMD_FILTER.value:
+            coefficients = ct.cast(cds.pParam, ct.POINTER(ct.c_float * 4))[0] if cds.pParam else None
+            for system, rows, _ in targets:
+                for row in rows:
+                    key = (row, cds.iParam)
+                    if action == ACTION.G4_ACTION_SET.value:
+                        system.filters[key] = list(coefficients)
+                    elif action == ACTION.G4_ACTION_RESET.value:
+                        system.filters.pop(key, None)
+            if action == ACTION.G4_ACTION_GET.value:
+                coefficients[:] = system.filters.get((rows[0], cds.iParam), default_filter)
+        elif cmd == COMMANDS.G4_CMD_BLOCK_CFG.value:
+            self._block_command(cds, targets)
+        elif cmd == COMMANDS.G4_CMD_RESTORE_DEF_CFG.value:
+            for system, _, _ in targets:
+                system.__init__(len(self.hub_ids), self.sensors)
+        else:
+            return _status(ERROR.G4_ERROR_UNSUPPORTED_COMMAND)
+
+        return _status(ERROR.G4_ERROR_NONE)
+
+    def _boresight(self, system, rows, sensors, angles):
+        """
+        Align the current orientation of the given sensors to the reference angles
+        """
+        hub_ids = [self.hub_ids[row] for row in rows]
+        _, rotation = self.sensor_pose(hub_ids, self.current_frame())
+        rotation = rotation[:, sensors]
+        target = euler_to_matrix(system.rotation) @ euler_to_matrix(angles)
+        system.boresight[np.ix_(rows, sensors)] = np.swapaxes(rotation, -1, -2) @ target
+        system.boresight_angles[np.ix_(rows, sensors)] = angles
+        system.boresight_active = True
+
+    def _block_command(self, cds, targets):
+        """
+        Get, set or reset the whole configuration of a hub (G4CMDBlockStruct), the positions in the unit of
+        iParam >> 16 and the angles in the unit of iParam & 0xFFFF
+        """
+        scale = unit_cm.get(cds.iParam >> 16, 1.0)
+        angle_scale = 180 / np.pi if cds.iParam & 0xFFFF == UNITS.G4_TYPE_EULER_RADIAN.value else 1.0
+        pos, ori = DATATYPE.G4_DATA_POS.value, DATATYPE.G4_DATA_ORI.value
+
+        if cds.action == ACTION.G4_ACTION_GET.value:
+            system, rows, _ = targets[0]
+            row = rows[0]
+            block = ct.cast(cds.pParam, ct.POINTER(G4CMDBlockStruct))[0]
+            block.units[0] = system.units[pos]
+            block.units[1] = system.units[ori]
+            version = b"SimulatedG4Track"
+            block.version_info[:len(version)] = list(version)
+            block.filter_params[pos][:] = system.filters.get((row, pos), default_filter)
+            block.filter_params[ori][:] = system.filters.get((row, ori), default_filter)
+            for i in range(self.sensors):
+                block.increment[i][:] = system.increments[row, i]
+                block.tip_offset[i][:] = system.tip_offsets[row, i] / scale
+            block.rot_angles[:] = system.rotation / angle_scale
+            block.translate_xyz[:] = system.translation / scale
+            return
+
+        for system, rows, _ in targets:
+            if cds.action == ACTION.G4_ACTION_SET.value:
+                block = ct.cast(cds.pParam, ct.POINTER(G4CMDBlockStruct))[0]
+                system.units[pos] = block.units[0]
+                system.units[ori] = block.units[1]
+                system.rotation = np.array(block.rot_angles) * angle_scale
+                system.translation = np.array(block.translate_xyz) * scale
+                for row in rows:
+                    system.filters[(row, pos)] = list(block.filter_params[pos])
+                    system.filters[(row, ori)] = list(block.filter_params[ori])
+                    system.increments[row] = np.array(block.increment)[:self.sensors]
+                    system.tip_offsets[row] = np.array(block.tip_offset)[:self.sensors] * scale
+            else:
+                default = SimulatedSystem(len(self.hub_ids), self.sensors)
+                system.units = default.units
+                system.rotation = default.rotation
+                system.translation = default.translation
+                for row in rows:
+                    system.filters.pop((row, pos), None)
+                    system.filters.pop((row, ori), None)
+                    system.increments[row] = 0
+                    system.tip_offsets[row] = 0
+
+    def _vector_command(self, cds, targets, name, size, scale, default):
+        """
+        Set, get or reset a vector of a system (frame of reference), the values are converted with scale
+        """
+        if cds.action == ACTION.G4_ACTION_GET.value:
+            values = ct.cast(cds.pParam, ct.POINTER(ct.c_float * size))[0]
+            values[:] = getattr(targets[0][0], name) / scale
+            return
+        for system, _, _ in targets:
+            if cds.action == ACTION.G4_ACTION_SET.value:
+                values = ct.cast(cds.pParam, ct.POINTER(ct.c_float * size))[0]
+                setattr(system, name, np.array(values) * scale)
+            else:
+                setattr(system, name, default.copy())
+
+    def _sensor_command(self, cds, targets, name, size, scale):
+        """
+        Set, get or reset a vector per sensor (tip offset, increment), the values are converted with scale
+        """
+        if cds.action == ACTION.G4_ACTION_GET.value:
+            system, rows, sensors = targets[0]
+            values = ct.cast(cds.pParam, ct.POINTER(ct.c_float * size))[0]
+            values[:] = getattr(system, name)[rows[0], sensors[0]] / scale
+            return
+        for system, rows, sensors in targets:
+            if cds.action == ACTION.G4_ACTION_SET.value:
+                values = ct.cast(cds.pParam, ct.POINTER(ct.c_float * size))[0]
+                getattr(system, name)[np.ix_(rows, sensors)] = np.array(values) * scale
+            else:
+                getattr(system, name)[np.ix_(rows, sensors)] = 0
+
+
+class ReplayG4Track(SimulatedG4Track):
+    """
+    Stand-in for G4Track.dll that plays back a recording (see G4Recording), to be given to 'use_backend'. Each
+    requested hub gets its last recorded frame at or before the current frame number. After the last recorded
+    frame, g4_get_frame_data returns no data.
+
+    :Attributes:
+    - recording:    the played recording
+    - speed:        1 for real time, 2 for twice as fast, ..., None to advance one frame per g4_get_frame_data
+        call (as fast as possible and deterministic)
+    """
+    def __init__(self, path, speed=1.0, dongle_id=1, clock=time.perf_counter):
+        self.recording = Recording(path)
+        frames = np.concatenate([records["fd"]["frame"] for records in self.recording.records]).astype(np.int64)
+        timestamps = np.concatenate([records["timestamp"] for records in self.recording.records])
+
+        # per hub, the global indices of its records and their frame numbers
+        hub_index = self.recording.hub_index()
+        self._hub_indices = {hub_id: indices for hub_id, (indices, hub_frames) in hub_index.items()}
+        self._hub_frames = {hub_id: hub_frames for hub_id, (indices, hub_frames) in hub_index.items()}
+        self.first_frame = int(frames.min()) if len(frames) else 0
+        self.last_frame = int(frames.max()) if len(frames) else -1
+        duration = timestamps[-1] - timestamps[0] if len(timestamps) else 0
+        frame_rate = round((self.last_frame - self.first_frame) / duration) if duration > 0 else 120
+
+        super().__init__(hub_ids=sorted(self._hub_indices), frame_rate=frame_rate, dongle_id=dongle_id,
+                         clock=clock)
+        self.speed = speed
+        self._calls = 0
+
+    def current_frame(self):
+        if self.start_time is None:
+            return self.first_frame
+        if self.speed is None:
+            self._calls += 1
+            return self.first_frame + self._calls - 1
+        return self.first_frame + int((self.clock() - self.start_time) * self.frame_rate * self.speed)
+
+    def g4_init_sys(self, dongle_id, src_cfg_file, reserved):
+        self._calls = 0
+        return super().g4_init_sys(dongle_id, src_cfg_file, reserved)
+
+    def g4_get_frame_data(self, fd_array, sys_id, hub_id_list, num_hubs):
+        sys_id = getattr(sys_id, "value", sys_id)
+        num_hubs = getattr(num_hubs, "value", num_hubs)
+        if self.start_time is None or sys_id != self.dongle_id:
+            return 0
+
+        frames = ct.cast(fd_array, ct.POINTER(G4FrameData))
+        hubs = ct.cast(hub_id_list, ct.POINTER(ct.c_int))
+        frame = self.current_frame()
+        if frame > self.last_frame:
+            return len(self.hub_ids) << 16
+
+        hub_count = 0
+        for i in range(num_hubs):
+            if self.fill_frame(frames[i], hubs[i], frame):
+                hub_count += 1
+
+        return (len(self.hub_ids) << 16) | hub_count
+
+    def fill_frame(self, fd, hub_id, frame):
+        """
+        Copy the last recorded frame of a hub at or before the given frame number
+        :return: True if the hub has such a frame
+        :rtype: bool
+        """
+        hub_frames = self._hub_frames.get(hub_id)
+        if hub_frames is None:
+            return False
+        position = np.searchsorted(hub_frames, frame, side="right") - 1
+        if position < 0:
+            return False
+
+        index = self._hub_indices[hub_id][position]
+        file_index = np.searchsorted(self.recording.starts, index, side="right") - 1
+        records = self.recording.records[file_index]
+        address = records.ctypes.data + int(index - self.recording.starts[file_index]) * records.itemsize \
+            + G4Record.fd.offset
+        ct.memmove(ct.addressof(fd), address, ct.sizeof(G4FrameData))
+        return True
+
+    def g4_set_query(self, pcs):
+        cmd_struct = ct.cast(pcs, ct.POINTER(G4CMDStruct))[0]
+        if cmd_struct.cmd == COMMANDS.G4_CMD_GET_STATION_MAP.value:
+            hub_id = (cmd_struct.cds.id >> 8) & 0xfff
+            fd = G4FrameData()
+            cmd_struct.cds.iParam = fd.stationMap if self.fill_frame(fd, hub_id, self.last_frame) else 0
+            return _status(ERROR.G4_ERROR_NONE)
+        return super().g4_set_query(pcs)
@@ -1,9 +1,11 @@
+import bisect
 import ctypes as ct
 import os
+import threading
+import time
 from enum import Enum
 
 file_directory = os.path.dirname(os.path.abspath(__file__))
-G4Track = ct.CDLL(os.path.join(file_directory, "G4Track.dll"))
 G4_sensors_per_hub = 3
 
 
@@ -207,22 +209,304 @@ class UNITS(Enum):
     G4_TYPE_METER = 6
 
 
-# uint32_t g4_init_sys(int* pDongleId,const char* src_cfg_file,void* reserved)
-G4Track.g4_init_sys.argtypes = [ct.POINTER(ct.c_int), ct.c_char_p, ct.c_void_p]
-G4Track.g4_init_sys.restype = ct.c_uint32
+def load_library(path=None):
+    """
+    Open the G4Track library and declare the signatures of the functions used by this module
+    :param path: path to the library (default: G4Track.dll next to this file)
+    :type path: str
+    :return: the library with typed arguments and return values
+    :rtype: ct.CDLL
+    """
+    G4Track = ct.CDLL(path or os.path.join(file_directory, "G4Track.dll"))
+
+    # uint32_t g4_init_sys(int* pDongleId,const char* src_cfg_file,void* reserved)
+    G4Track.g4_init_sys.argtypes = [ct.POINTER(ct.c_int), ct.c_char_p, ct.c_void_p]
+    G4Track.g4_init_sys.restype = ct.c_uint32
+
+    # void g4_close_tracker(void)
+    G4Track.g4_close_tracker.argtypes = ()
+    G4Track.g4_close_tracker.restype = None
+
+    # uint32_t g4_get_frame_data(G4_FRAMEDATA* fd_array, int sysId, const int* hub_id_list, int num_hubs)
+    G4Track.g4_get_frame_data.argtypes = [ct.POINTER(G4FrameData), ct.c_int,
+                                          ct.POINTER(ct.c_int), ct.c_int]
+    G4Track.g4_get_frame_data.restype = ct.c_uint32
+
+    # uint32_t g4_set_query(LPG4_CMD_STRUCT pcs)
+    G4Track.g4_set_query.argtypes = [ct.POINTER(G4CMDStruct)]
+    G4Track.g4_set_query.restype = ct.c_uint32
+
+    return G4Track
+
+
+class G4Session:
+    """
+    Owner of the one library handle used by all functions of this module. The backend can be the real
+    G4Track.dll or any object with the same g4_* functions (e.g. a simulator), which receive the same ctypes
+    arguments and return the unsigned status
+
+    :Attributes:
+    - lib:    the G4Track library (or a stand-in for it)
+    """
+    def __init__(self, backend=None):
+        self.lib = load_library() if backend is None else backend
+        if _instrumentation is not None:
+            self.lib = InstrumentedLibrary(self.lib, _instrumentation)
+
+
+_session = None
+
+
+def get_session():
+    """
+    Get the session of this process, the G4Track library is only opened the first time
+    :return: the current session
+    :rtype: G4Session
+    """
+    global _session
+    if _session is None:
+        _session = G4Session()
+    return _session
+
+
+def use_backend(backend=None):
+    """
+    Replace the library used by all functions of this module (e.g. by a simulator to run without a tracker)
+    :param backend: object implementing g4_init_sys, g4_close_tracker, g4_get_frame_data and g4_set_query
+        (None to open G4Track.dll)
+    :return: the new session
+    :rtype: G4Session
+    """
+    global _session
+    _session = G4Session(backend)
+    return _session
+
+
+# upper bounds in seconds of the buckets of the latency histograms
+latency_buckets = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Instrumentation:
+    """
+    Counters of the calls of the G4Track library, filled by InstrumentedLibrary (see 'enable_instrumentation'):
+
+    :Attributes:
+    - latency:      per function, the number of calls per bucket of latency_buckets (the last bucket for slower
+                    calls), the number of calls and the total time in seconds
+    - commands:     number of g4_set_query calls per (COMMANDS name, ACTION name)
+    - statuses:     number of calls per (function, ERROR name), a g4_get_frame_data call without any hub worth of
+                    data counts as G4_ERROR_NO_FRAME_DATA_AVAIL
+    - frame_gaps:   number of frame numbers skipped between two frames of a hub, per (system id, hub id)
+    - repeated_frames:  number of frames returned again with the same frame number, per (system id, hub id)
+    """
+    def __init__(self):
+        self.latency = {}
+        self.commands = {}
+        self.statuses = {}
+        self.frame_gaps = {}
+        self.repeated_frames = {}
+        self._last_frames = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Set all counters to zero
+        """
+        with self._lock:
+            for counters in (self.latency, self.commands, self.statuses, self.frame_gaps, self.repeated_frames,
+                             self._last_frames):
+                counters.clear()
+
+    def record_call(self, function, elapsed_time, status):
+        with self._lock:
+            latency = self.latency.get(function)
+            if latency is None:
+                latency = self.latency[function] = {"buckets": [0] * (len(latency_buckets) + 1), "count": 0,
+                                                    "sum": 0.0}
+            latency["buckets"][bisect.bisect_left(latency_buckets, elapsed_time)] += 1
+            latency["count"] += 1
+            latency["sum"] += elapsed_time
+            key = (function, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def record_command(self, cmd, action):
+        key = (COMMANDS(cmd).name if cmd in _command_values else str(cmd),
+               ACTION(action).name if action in _action_values else str(action))
+        with self._lock:
+            self.commands[key] = self.commands.get(key, 0) + 1
+
+    def record_frame(self, sys_id, hub_id, frame):
+        key = (sys_id, hub_id)
+        with self._lock:
+            last_frame = self._last_frames.get(key)
+            self._last_frames[key] = frame
+            if last_frame is None:
+                return
+            if frame == last_frame:
+                self.repeated_frames[key] = self.repeated_frames.get(key, 0) + 1
+            elif frame > last_frame + 1:
+                self.frame_gaps[key] = self.frame_gaps.get(key, 0) + frame - last_frame - 1
+
+    def snapshot(self):
+        """
+        :return: a copy of all counters
+        :rtype: dict
+        """
+        with self._lock:
+            return {"latency": {function: {"buckets": dict(zip(latency_buckets + (float("inf"),),
+                                                               latency["buckets"])),
+                                           "count": latency["count"], "sum": latency["sum"]}
+                                for function, latency in self.latency.items()},
+                    "commands": dict(self.commands),
+                    "statuses": dict(self.statuses),
+                    "frame_gaps": dict(self.frame_gaps),
+                    "repeated_frames": dict(self.repeated_frames)}
+
+    def prometheus_text(self):
+        """
+        :return: the counters in the Prometheus text exposition format
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        lines = ["# HELP g4_call_duration_seconds Duration of the calls of the G4Track library.",
+                 "# TYPE g4_call_duration_seconds histogram"]
+        for function, latency in snapshot["latency"].items():
+            total = 0
+            for bound, count in latency["buckets"].items():
+                total += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'g4_call_duration_seconds_bucket{{function="{function}",le="{le}"}} {total}')
+            lines.append(f'g4_call_duration_seconds_sum{{function="{function}"}} {latency["sum"]!r}')
+            lines.append(f'g4_call_duration_seconds_count{{function="{function}"}} {latency["count"]}')
+
+        lines += ["# HELP g4_commands_total Calls of g4_set_query per command and action.",
+                  "# TYPE g4_commands_total counter"]
+        lines += [f'g4_commands_total{{command="{command}",action="{action}"}} {count}'
+                  for (command, action), count in snapshot["commands"].items()]
+
+        lines += ["# HELP g4_status_total Calls of the G4Track library per status.",
+                  "# TYPE g4_status_total counter"]
+        lines += [f'g4_status_total{{function="{function}",status="{status}"}} {count}'
+                  for (function, status), count in snapshot["statuses"].items()]
+
+        lines += ["# HELP g4_frame_gaps_total Frame numbers skipped between two frames of a hub.",
+                  "# TYPE g4_frame_gaps_total counter"]
+        lines += [f'g4_frame_gaps_total{{system="{sys_id}",hub="{hub_id}"}} {count}'
+                  for (sys_id, hub_id), count in snapshot["frame_gaps"].items()]
+
+        lines += ["# HELP g4_repeated_frames_total Frames returned again with the same frame number.",
+                  "# TYPE g4_repeated_frames_total counter"]
+        lines += [f'g4_repeated_frames_total{{system="{sys_id}",hub="{hub_id}"}} {count}'
+                  for (sys_id, hub_id), count in snapshot["repeated_frames"].items()]
+        return "\n".join(lines) + "\n"
+
+
+_command_values = {command.value for command in COMMANDS}
+_action_values = {action.value for action in ACTION}
+_error_names = {error.value: error.name for error in ERROR}
+
+
+def _status_name(status):
+    status = status & 0xFFFFFFFF
+    if status & 0x80000000:
+        status -= 0x100000000
+    return _error_names.get(status, str(status))
+
+
+def _value(argument):
+    return getattr(argument, "value", argument)
+
+
+class InstrumentedLibrary:
+    """
+    Stand-in for the G4Track library (or another backend) that times every call and fills an Instrumentation. It
+    is only put in place by 'enable_instrumentation', without it the wrappers call the library directly.
+
+    :Attributes:
+    - lib:              the instrumented library
+    - instrumentation:  the counters
+    """
+    def __init__(self, lib, instrumentation):
+        self.lib = lib
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        return getattr(self.lib, name)
+
+    def g4_init_sys(self, dongle_id, src_cfg_file, reserved):
+        start_time = time.perf_counter()
+        status = self.lib.g4_init_sys(dongle_id, src_cfg_file, reserved)
+        self.instrumentation.record_call("g4_init_sys", time.perf_counter() - start_time, _status_name(status))
+        return status
+
+    def g4_close_tracker(self):
+        start_time = time.perf_counter()
+        self.lib.g4_close_tracker()
+        self.instrumentation.record_call("g4_close_tracker", time.perf_counter() - start_time,
+                                         ERROR.G4_ERROR_NONE.name)
+
+    def g4_get_frame_data(self, fd_array, sys_id, hub_id_list, num_hubs):
+        start_time = time.perf_counter()
+        res = self.lib.g4_get_frame_data(fd_array, sys_id, hub_id_list, num_hubs)
+        elapsed_time = time.perf_counter() - start_time
+
+        hub_count = res & 0xFFFF
+        status = ERROR.G4_ERROR_NONE.name if hub_count else ERROR.G4_ERROR_NO_FRAME_DATA_AVAIL.name
+        self.instrumentation.record_call("g4_get_frame_data", elapsed_time, status)
+        if hub_count:
+            # byref(fd) for a single frame, a pointer to an array of frames otherwise
+            frames = fd_array._obj if hasattr(fd_array, "_obj") else fd_array
+            sys_id = _value(sys_id)
+            for i in range(_value(num_hubs)):
+                fd = frames if isinstance(frames, G4FrameData) else frames[i]
+                if fd.stationMap != 0:
+                    self.instrumentation.record_frame(sys_id, fd.hub, fd.frame)
+        return res
+
+    def g4_set_query(self, pcs):
+        cs = pcs._obj if hasattr(pcs, "_obj") else pcs.contents
+        self.instrumentation.record_command(cs.cmd, cs.cds.action)
+        start_time = time.perf_counter()
+        status = self.lib.g4_set_query(pcs)
+        self.instrumentation.record_call("g4_set_query", time.perf_counter() - start_time, _status_name(status))
+        return status
+
+
+_instrumentation = None
+
+
+def enable_instrumentation():
+    """
+    Start counting the calls of the G4Track library (latency, commands, statuses and frame gaps). Without it, the
+    functions of this module call the library without any overhead.
+    :return: the counters, also returned by 'get_instrumentation'
+    :rtype: Instrumentation
+    """
+    global _instrumentation
+    if _instrumentation is None:
+        _instrumentation = Instrumentation()
+    session = get_session()
+    if not isinstance(session.lib, InstrumentedLibrary):
+        session.lib = InstrumentedLibrary(session.lib, _instrumentation)
+    return _instrumentation
 
-# void g4_close_tracker(void)
-G4Track.g4_close_tracker.argtypes = ()
-G4Track.g4_close_tracker.restype = None
 
-# uint32_t g4_get_frame_data(G4_FRAMEDATA* fd_array, int sysId, const int* hub_id_list, int num_hubs)
-G4Track.g4_get_frame_data.argtypes = [ct.POINTER(G4FrameData), ct.c_int,
-                                      ct.POINTER(ct.c_int), ct.c_int]
-G4Track.g4_get_frame_data.restype = ct.c_uint32
+def disable_instrumentation():
+    """
+    Stop counting the calls of the G4Track library, the counters are kept
+    """
+    global _instrumentation
+    _instrumentation = None
+    if _session is not None and isinstance(_session.lib, InstrumentedLibrary):
+        _session.lib = _session.lib.lib
 
-# uint32_t g4_set_query(LPG4_CMD_STRUCT pcs)
-G4Track.g4_set_query.argtypes = [ct.POINTER(G4CMDStruct)]
-G4Track.g4_set_query.restype = ct.c_uint32
+
+def get_instrumentation():
+    """
+    :return: the counters, None if the instrumentation is not enabled
+    :rtype: Instrumentation
+    """
+    return _instrumentation
 
 
 def initialize_system(src_cfg_file):
@@ -235,10 +519,8 @@ def initialize_system(src_cfg_file):
     :rtype: (bool, int)
     """
 
-    G4Track = ct.CDLL(os.path.join(file_directory, "G4Track.dll"))
-
     dongle_id_c = ct.c_int()
-    status = G4Track.g4_init_sys(ct.byref(dongle_id_c), src_cfg_file.encode('utf-8'), ct.c_void_p(None))
+    status = get_session().lib.g4_init_sys(ct.byref(dongle_id_c), src_cfg_file.encode('utf-8'), ct.c_void_p(None))
 
     # numbers are still unsigned --> convert to signed by substracting 2^32 or 0x100000000
     if status > 0:
@@ -258,9 +540,7 @@ def close_sensor():
     """
     Delete connection with the sensor
     """
-    G4Track = ct.CDLL(os.path.join(file_directory, "G4Track.dll"))
-    G4Track.g4_close_tracker()
-    del G4Track
+    get_session().lib.g4_close_tracker()
 
 
 def get_frame_data(system_id, hub_id_list):
@@ -274,11 +554,9 @@ def get_frame_data(system_id, hub_id_list):
      and a number of hubs worth of data returned in the fd (default set to 1)
     :rtype: (G4FrameData, int, int)
     """
-    G4Track = ct.CDLL(os.path.join(file_directory, "G4Track.dll"))
-
     fd = G4FrameData()
     hub_id_c = (ct.c_int * len(hub_id_list))(*hub_id_list)
-    res = G4Track.g4_get_frame_data(ct.byref(fd), ct.c_int(system_id), hub_id_c, 1)
+    res = get_session().lib.g4_get_frame_data(ct.byref(fd), ct.c_int(system_id), hub_id_c, 1)
 
     res = res & 0xFFFFFFFF
     active_hubs = (res >> 16) & 0xFFFF
@@ -287,6 +565,85 @@ def get_frame_data(system_id, hub_id_list):
     return fd, active_hubs, hub_count
 
 
+class FrameReader:
+    """
+    Same as 'get_frame_data', but the frame buffers and the hub id array are allocated once and reused by every
+    read (no allocation per frame at 120 Hz). The returned frames are overwritten by the next read, copy them with
+    the 'out' parameter to keep them.
+
+    :Attributes:
+    - system_id:    system id (result of the function initialize_system)
+    - hub_id_list:  array of hub ids the user is requesting data from
+    - frames:       the reused contiguous array of G4FrameData (one per hub of hub_id_list)
+    - fd:           the first frame of frames, used by 'read'
+    - valid:        per hub of hub_id_list, True if the last 'read_hubs' returned data for it
+    """
+    def __init__(self, system_id, hub_id_list):
+        self.system_id = system_id
+        self.hub_id_list = list(hub_id_list)
+        self.frames = (G4FrameData * len(self.hub_id_list))()
+        self.fd = self.frames[0]
+        self.valid = [False] * len(self.hub_id_list)
+        self._frames_ptr = ct.cast(self.frames, ct.POINTER(G4FrameData))
+        self._frames_size = ct.sizeof(self.frames)
+        self._hub_id_c = (ct.c_int * len(self.hub_id_list))(*self.hub_id_list)
+
+    def read(self, out=None):
+        """
+        Retrieve position & orientation from the first hub of hub_id_list (single frame)
+        :param out: frame to copy the result into (None to only use the reused frame of the reader)
+        :type out: G4FrameData
+        :return: the frame (out if given), a number of active hubs and a number of hubs worth of data returned
+        :rtype: (G4FrameData, int, int)
+        """
+        res = get_session().lib.g4_get_frame_data(self._frames_ptr, self.system_id, self._hub_id_c, 1)
+
+        res = res & 0xFFFFFFFF
+        active_hubs = (res >> 16) & 0xFFFF
+        hub_count = res & 0xFFFF
+
+        if out is None:
+            return self.fd, active_hubs, hub_count
+
+        ct.memmove(ct.addressof(out), ct.addressof(self.fd), ct.sizeof(G4FrameData))
+        return out, active_hubs, hub_count
+
+    def read_hubs(self, out=None):
+        """
+        Retrieve position & orientation from all hubs of hub_id_list with a single call of g4_get_frame_data
+        :param out: array of G4FrameData (at least as long as hub_id_list) to copy the result into
+            (None to only use the reused frames of the reader)
+        :type out: ct.Array[G4FrameData]
+        :return: the frames (out if given), a list with True for each hub that returned data, a number of active
+            hubs and a number of hubs worth of data returned (None, no valid hub and 0, 0 if out is too short)
+        :rtype: (ct.Array[G4FrameData], list[bool], int, int)
+        """
+        if out is not None and ct.sizeof(out) < self._frames_size:
+            print(f"Error: out holds {ct.sizeof(out) // ct.sizeof(G4FrameData)} frames, "
+                  f"{len(self.hub_id_list)} are needed.")
+            self.valid[:] = [False] * len(self.hub_id_list)
+            return None, self.valid, 0, 0
+
+        # hubs without data leave their frame untouched, clear them to recognise it with the station map
+        ct.memset(self._frames_ptr, 0, self._frames_size)
+        res = get_session().lib.g4_get_frame_data(self._frames_ptr, self.system_id, self._hub_id_c,
+                                                  len(self.hub_id_list))
+
+        res = res & 0xFFFFFFFF
+        active_hubs = (res >> 16) & 0xFFFF
+        hub_count = res & 0xFFFF
+
+        for i, hub_id in enumerate(self.hub_id_list):
+            fd = self.frames[i]
+            self.valid[i] = hub_count > 0 and fd.stationMap != 0 and fd.hub == hub_id
+
+        if out is None:
+            return self.frames, self.valid, active_hubs, hub_count
+
+        ct.memmove(out, self.frames, self._frames_size)
+        return out, self.valid, active_hubs, hub_count
+
+
 def create_id(sys=-1, hub=0, sensor=0):
     """
     Create an id of the given input, needed for the Commands ('set_query'), no parameters needed
@@ -352,7 +709,7 @@ def who_am_i(sys_id, hub_id=0, sensor_id=0):
     version_info = G4SystemInfo()
     cmd_struct.cds.pParam = ct.cast(ct.byref(version_info), ct.c_void_p)
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
     if status > 1:
         status = status - 0x100000000
@@ -373,7 +730,7 @@ def get_max_sources():
     cmd_struct = G4CMDStruct()
     cmd_struct.cmd = COMMANDS.G4_CMD_GETMAXSRC.value
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
     if status > 0:
         status = status - 0x100000000
@@ -409,15 +766,15 @@ def boresight(sys_id, hub_id, sen_id, pos_init=None):
     cmd_struct.cds.iParam = UNITS.G4_TYPE_EULER_DEGREE.value
 
     if pos_init is None:
-        pos = (ct.c_int * 3)()
+        pos = (ct.c_float * 3)()
         cmd_struct.cds.action = ACTION.G4_ACTION_GET.value
     else:
-        pos = (ct.c_int * 3)(*pos_init)
+        pos = (ct.c_float * 3)(*pos_init)
         cmd_struct.cds.action = ACTION.G4_ACTION_SET.value
 
     cmd_struct.cds.pParam = ct.cast(ct.byref(pos), ct.c_void_p)
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
     if status > 0:
         status = status - 0x100000000
@@ -456,7 +813,7 @@ def boresight_reset(sys_id=-1, hub_id=0, sen_id=(0,)):
     cmd_struct.cds.action = ACTION.G4_ACTION_RESET.value
     cmd_struct.cds.iParam = UNITS.G4_TYPE_EULER_DEGREE.value
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
     if status > 0:
         status = status - 0x100000000
@@ -500,7 +857,9 @@ def filter(sys_id, hub_id, return_pos=True, filter_coef_init=None):
 
     cmd_struct.cds.pParam = ct.cast(ct.byref(filter_coef), ct.c_void_p)
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    if filter_coef_init is not None:
+        invalidate_config(sys_id, COMMANDS.G4_CMD_FILTER)
 
     if status > 0:
         status = status - 0x100000000
@@ -537,7 +896,8 @@ def filter_reset(sys_id, hub_id, return_pos=True):
         cmd_struct.cds.iParam = DATATYPE.G4_DATA_ORI.value
 
     cmd_struct.cds.action = ACTION.G4_ACTION_RESET.value
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    invalidate_config(sys_id, COMMANDS.G4_CMD_FILTER)
 
     if status > 0:
         status = status - 0x100000000
@@ -581,7 +941,9 @@ def increment(sys_id, hub_id, sen_id, posori_init=None):
 
     cmd_struct.cds.pParam = ct.cast(ct.byref(posori), ct.c_void_p)
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    if posori_init is not None:
+        invalidate_config(sys_id, COMMANDS.G4_CMD_INCREMENT)
 
     if status > 0:
         status = status - 0x100000000
@@ -608,7 +970,7 @@ def increment_reset(sys_id=-1, hub_id=0, sen_id=(0,)):
     :return: the position if there was no position given, otherwise the status
     """
     cmd_struct = G4CMDStruct()
-    cmd_struct.cmd = COMMANDS.G4_CMD_BORESIGHT.value
+    cmd_struct.cmd = COMMANDS.G4_CMD_INCREMENT.value
 
     if len(sen_id) == 1:
         sen_id = sen_id[0]
@@ -617,7 +979,8 @@ def increment_reset(sys_id=-1, hub_id=0, sen_id=(0,)):
         cmd_struct.cds.id = create_id_sensormap(sys_id, hub_id, id_to_sensormap(sen_id))
     cmd_struct.cds.iParam = UNITS.G4_TYPE_CM.value << 16 | UNITS.G4_TYPE_EULER_DEGREE.value
     cmd_struct.cds.action = ACTION.G4_ACTION_RESET.value
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    invalidate_config(sys_id, COMMANDS.G4_CMD_INCREMENT)
 
     if status > 0:
         status = status - 0x100000000
@@ -651,7 +1014,9 @@ def frame_reference_orientation(sys_id, degree_init=None):
         cmd_struct.cds.action = ACTION.G4_ACTION_SET.value
 
     cmd_struct.cds.pParam = ct.cast(ct.byref(degree), ct.c_void_p)
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    if degree_init is not None:
+        invalidate_config(sys_id, COMMANDS.G4_CMD_FOR_ROTATE)
 
     if status > 0:
         status = status - 0x100000000
@@ -678,7 +1043,8 @@ def frame_reference_orientation_reset(sys_id):
     cmd_struct.cds.id = create_id(sys_id)
     cmd_struct.cds.iParam = UNITS.G4_TYPE_EULER_DEGREE.value
     cmd_struct.cds.action = ACTION.G4_ACTION_RESET.value
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    invalidate_config(sys_id, COMMANDS.G4_CMD_FOR_ROTATE)
 
     if status > 0:
         status = status - 0x100000000
@@ -712,7 +1078,9 @@ def frame_reference_translation(sys_id, pos_init=None):
         cmd_struct.cds.action = ACTION.G4_ACTION_SET.value
 
     cmd_struct.cds.pParam = ct.cast(ct.byref(pos), ct.c_void_p)
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    if pos_init is not None:
+        invalidate_config(sys_id, COMMANDS.G4_CMD_FOR_TRANSLATE)
 
     if status > 0:
         status = status - 0x100000000
@@ -739,7 +1107,8 @@ def frame_reference_translation_reset(sys_id):
     cmd_struct.cds.id = create_id(sys_id)
     cmd_struct.cds.iParam = UNITS.G4_TYPE_CM.value
     cmd_struct.cds.action = ACTION.G4_ACTION_RESET.value
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    invalidate_config(sys_id, COMMANDS.G4_CMD_FOR_TRANSLATE)
 
     if status > 0:
         status = status - 0x100000000
@@ -782,7 +1151,9 @@ def tip_offsets(sys_id, hub_id, sen_id, tof_init=None):
         cmd_struct.cds.action = ACTION.G4_ACTION_SET.value
 
     cmd_struct.cds.pParam = ct.cast(ct.byref(tof), ct.c_void_p)
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    if tof_init is not None:
+        invalidate_config(sys_id, COMMANDS.G4_CMD_TIP_OFFSET)
 
     if status > 0x7FFFFFFF:
         status = status - 0x100000000
@@ -819,7 +1190,8 @@ def tip_offsets_reset(sys_id, hub_id, sen_id):
         cmd_struct.cds.id = create_id_sensormap(sys_id, hub_id, id_to_sensormap(sen_id))
     cmd_struct.cds.iParam = UNITS.G4_TYPE_CM.value
     cmd_struct.cds.action = ACTION.G4_ACTION_RESET.value
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    invalidate_config(sys_id, COMMANDS.G4_CMD_TIP_OFFSET)
 
     if status > 0:
         status = status - 0x100000000
@@ -845,7 +1217,8 @@ def set_units(sys_id):
     cmd_struct.cds.action = ACTION.G4_ACTION_SET.value
     cmd_struct.cds.iParam = DATATYPE.G4_DATA_ORI.value
     cmd_struct.cds.pParam = ct.cast(ct.pointer(ct.c_int(UNITS.G4_TYPE_EULER_DEGREE.value)), ct.c_void_p)
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    invalidate_config(sys_id, COMMANDS.G4_CMD_UNITS)
 
     if status > 0:
         status = status - 0x100000000
@@ -856,7 +1229,7 @@ def set_units(sys_id):
 
     cmd_struct.cds.iParam = DATATYPE.G4_DATA_POS.value
     cmd_struct.cds.pParam = ct.cast(ct.pointer(ct.c_int(UNITS.G4_TYPE_CM.value)), ct.c_void_p)
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
     if status > 0:
         status = status - 0x100000000
@@ -888,7 +1261,7 @@ def get_units(sys_id, hub_id):
     cmd_struct.cds.iParam = DATATYPE.G4_DATA_ORI.value
     res_ori_value = ct.c_uint(res_ori)
     cmd_struct.cds.pParam = ct.cast(ct.byref(res_ori_value), ct.c_void_p)
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
     res_ori = res_ori_value.value
 
     if status > 0:
@@ -901,7 +1274,7 @@ def get_units(sys_id, hub_id):
     cmd_struct.cds.iParam = DATATYPE.G4_DATA_POS.value
     res_pos_value = ct.c_uint(res_pos)
     cmd_struct.cds.pParam = ct.cast(ct.byref(res_pos_value), ct.c_void_p)
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
     res_pos = res_pos_value.value
 
     if status == ERROR.G4_ERROR_NONE.value:
@@ -926,7 +1299,7 @@ def get_active_hubs(sys_id, id_needed=False):
     cmd_struct.cds.id = create_id(sys_id, 0, 0)
     cmd_struct.cds.action = ACTION.G4_ACTION_GET.value
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
     if status > 0:
         status = status - 0x100000000
@@ -939,15 +1312,12 @@ def get_active_hubs(sys_id, id_needed=False):
         hub_ids = (ct.c_int * cmd_struct.cds.iParam)()
         cmd_struct.cds.pParam = ct.cast(ct.byref(hub_ids), ct.c_void_p)
 
-        status = G4Track.g4_set_query(ct.byref(cmd_struct))
+        status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
         if status > 0:
             status = status - 0x100000000
 
         if status == ERROR.G4_ERROR_NONE.value:
-            for i in range(cmd_struct.cds.iParam):
-                hub_ids[i] = i
-
             return list(hub_ids)
         else:
             print(f"Error: Unexpected status code {ERROR(status).name}.")
@@ -970,7 +1340,7 @@ def get_station_map(sys_id, hub_id):
     cmd_struct.cmd = COMMANDS.G4_CMD_GET_STATION_MAP.value
     cmd_struct.cds.id = create_id(sys_id, hub_id, 0)
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
     if status > 0:
         status = status - 0x100000000
@@ -995,7 +1365,7 @@ def get_source_map(sys_id):
     cmd_struct.cmd = COMMANDS.G4_CMD_GET_SOURCE_MAP.value
     cmd_struct.cds.id = create_id(sys_id, 0, 0)
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
     if status > 0:
         status = status - 0x100000000
@@ -1008,7 +1378,7 @@ def get_source_map(sys_id):
     cmd_struct.cds.pParam = ct.cast(ct.byref(source_map), ct.c_void_p)
     cmd_struct.cds.iParam = ((UNITS.G4_TYPE_INCH.value << 16) | UNITS.G4_TYPE_EULER_DEGREE.value)
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
 
     if status > 0:
         status = status - 0x100000000
@@ -1020,6 +1390,31 @@ def get_source_map(sys_id):
         return False
 
 
+def get_frame_rate(sys_id):
+    """
+    Get the frame rate of a given system
+    :param sys_id: system id
+    :type sys_id: int
+    :return: the number of frames per second
+    :rtype: int
+    """
+    cmd_struct = G4CMDStruct()
+    cmd_struct.cmd = COMMANDS.G4_CMD_FRAMERATE.value
+    cmd_struct.cds.id = create_id(sys_id, 0, 0)
+    cmd_struct.cds.action = ACTION.G4_ACTION_GET.value
+
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+
+    if status > 0:
+        status = status - 0x100000000
+
+    if status == ERROR.G4_ERROR_NONE.value:
+        return cmd_struct.cds.iParam
+    else:
+        print(f"Error: Unexpected status code {ERROR(status).name}.")
+        return None
+
+
 def restore_default(sys_id=-1):
     """
     Restore the system to its default configuration
@@ -1032,7 +1427,8 @@ def restore_default(sys_id=-1):
     cmd_struct.cmd = COMMANDS.G4_CMD_RESTORE_DEF_CFG.value
     cmd_struct.cds.id = create_id(sys_id, 0, 0)
 
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    invalidate_config(sys_id)
 
     if status > 0:
         status = status - 0x100000000
@@ -1044,43 +1440,117 @@ def restore_default(sys_id=-1):
         return False
 
 
-def block_read_write(sys_id, hub_id, action):
+class HubConfig:
     """
-    (Not finished) Read, write or reset multiple configuration of a given hub
+    Configuration of a hub as read or written at once by 'block_read_write' (G4CMDBlockStruct), the positions are
+    in cm and the angles in degrees
+
+    :Attributes:
+    - units:            units of the position and orientation of the frames (UNITS, UNITS)
+    - version_info:     system version (only read)
+    - filter_pos:       filter coefficients of the position
+    - filter_ori:       filter coefficients of the orientation
+    - increments:       per sensor, the position and orientation increment
+    - rotation:         frame of reference of the orientation (azimuth, elevation, roll)
+    - translation:      frame of reference of the translation [x, y, z]
+    - tip_offsets:      per sensor, the tip offset [x, y, z]
+    """
+    def __init__(self, units=(UNITS.G4_TYPE_CM, UNITS.G4_TYPE_EULER_DEGREE), version_info="",
+                 filter_pos=(0.2, 0.2, 0.8, 0.95), filter_ori=(0.2, 0.2, 0.8, 0.95),
+                 increments=((0.0, 0.0),) * G4_sensors_per_hub, rotation=(0.0, 0.0, 0.0),
+                 translation=(0.0, 0.0, 0.0), tip_offsets=((0.0, 0.0, 0.0),) * G4_sensors_per_hub):
+        self.units = tuple(units)
+        self.version_info = version_info
+        self.filter_pos = tuple(filter_pos)
+        self.filter_ori = tuple(filter_ori)
+        self.increments = tuple(tuple(increment) for increment in increments)
+        self.rotation = tuple(rotation)
+        self.translation = tuple(translation)
+        self.tip_offsets = tuple(tuple(tip_offset) for tip_offset in tip_offsets)
+
+    def __repr__(self):
+        return (f"HubConfig(units=({self.units[0].name}, {self.units[1].name}), filter_pos={self.filter_pos}, "
+                f"filter_ori={self.filter_ori}, increments={self.increments}, rotation={self.rotation}, "
+                f"translation={self.translation}, tip_offsets={self.tip_offsets})")
+
+    @classmethod
+    def from_struct(cls, block):
+        """
+        :param block: block as filled by g4_set_query
+        :type block: G4CMDBlockStruct
+        :rtype: HubConfig
+        """
+        return cls(units=(UNITS(block.units[0]), UNITS(block.units[1])),
+                   version_info=bytes(c & 0xFF for c in block.version_info).split(b"\0")[0].decode(errors="replace"),
+                   filter_pos=list(block.filter_params[DATATYPE.G4_DATA_POS.value]),
+                   filter_ori=list(block.filter_params[DATATYPE.G4_DATA_ORI.value]),
+                   increments=[list(increment) for increment in block.increment],
+                   rotation=list(block.rot_angles),
+                   translation=list(block.translate_xyz),
+                   tip_offsets=[list(tip_offset) for tip_offset in block.tip_offset])
+
+    def to_struct(self):
+        """
+        :return: the block to give to g4_set_query
+        :rtype: G4CMDBlockStruct
+        """
+        block = G4CMDBlockStruct()
+        block.units[0] = self.units[0].value
+        block.units[1] = self.units[1].value
+        block.filter_params[DATATYPE.G4_DATA_POS.value][:] = self.filter_pos
+        block.filter_params[DATATYPE.G4_DATA_ORI.value][:] = self.filter_ori
+        for i in range(G4_sensors_per_hub):
+            block.increment[i][:] = self.increments[i]
+            block.tip_offset[i][:] = self.tip_offsets[i]
+        block.rot_angles[:] = self.rotation
+        block.translate_xyz[:] = self.translation
+        return block
+
+
+def block_read_write(sys_id, hub_id, action, config=None):
+    """
+    Read, write or reset the whole configuration of a given hub (units, filters, increments, frame of reference
+    and tip offsets) with a single g4_set_query
     :param sys_id: system id
     :type sys_id: int
     :param hub_id: hub id
     :type hub_id: int
     :param action: a string to specify the task of this function ('GET', 'SET', 'RESET')
     :type action: str
-    :return: a G4CMDBlockStruct with the information of the given hub or a status
-    :rtype: G4CMDBlockStruct | bool
+    :param config: the configuration to write (only for 'SET')
+    :type config: HubConfig
+    :return: the configuration of the given hub ('GET') or a status
+    :rtype: HubConfig | bool
     """
     cmd_struct = G4CMDStruct()
     cmd_struct.cmd = COMMANDS.G4_CMD_BLOCK_CFG.value
     cmd_struct.cds.id = create_id(sys_id, hub_id, 0)
 
-    res = G4CMDBlockStruct()
     if action.lower() == 'set':
-        cmd_struct.action = ACTION.G4_ACTION_SET.value
-        res.units = (ct.c_uint * 2)(*[UNITS.G4_TYPE_CM.value, UNITS.G4_TYPE_EULER_DEGREE.value])
-        # set all parameters here, still need to experiment with all
+        if config is None:
+            print("Error: No configuration given to set.")
+            return False
+        res = config.to_struct()
+        cmd_struct.cds.action = ACTION.G4_ACTION_SET.value
         cmd_struct.cds.pParam = ct.cast(ct.byref(res), ct.c_void_p)
     elif action.lower() == 'get':
-        cmd_struct.action = ACTION.G4_ACTION_GET.value
+        res = G4CMDBlockStruct()
+        cmd_struct.cds.action = ACTION.G4_ACTION_GET.value
         cmd_struct.cds.pParam = ct.cast(ct.byref(res), ct.c_void_p)
     else:
-        cmd_struct.action = ACTION.G4_ACTION_RESET.value
+        cmd_struct.cds.action = ACTION.G4_ACTION_RESET.value
 
     cmd_struct.cds.iParam = (UNITS.G4_TYPE_CM.value << 16 | UNITS.G4_TYPE_EULER_DEGREE.value)
-    status = G4Track.g4_set_query(ct.byref(cmd_struct))
+    status = get_session().lib.g4_set_query(ct.byref(cmd_struct))
+    if action.lower() != 'get':
+        invalidate_config(sys_id)
 
     if status > 0:
         status = status - 0x100000000
 
     if status == ERROR.G4_ERROR_NONE.value:
         if action.lower() == 'get':
-            return res
+            return HubConfig.from_struct(res)
         else:
             return True
     else:
@@ -1088,4 +1558,200 @@ def block_read_write(sys_id, hub_id, action):
         return None
 
 
+def read_hub_configs(sys_id, hub_id_list):
+    """
+    Read the configuration of several hubs, one g4_set_query per hub
+    :param sys_id: system id
+    :type sys_id: int
+    :param hub_id_list: hubs to read
+    :type hub_id_list: list[int]
+    :return: the configuration of each hub (None if it could not be read)
+    :rtype: dict[int, HubConfig]
+    """
+    return {hub_id: block_read_write(sys_id, hub_id, 'get') for hub_id in hub_id_list}
+
+
+def write_hub_configs(sys_id, hub_id_list, config):
+    """
+    Write the same configuration to several hubs, one g4_set_query per hub
+    :param sys_id: system id
+    :type sys_id: int
+    :param hub_id_list: hubs to configure
+    :type hub_id_list: list[int]
+    :param config: the configuration
+    :type config: HubConfig
+    :return: True if all hubs are configured
+    :rtype: bool
+    """
+    return all([block_read_write(sys_id, hub_id, 'set', config) is True for hub_id in hub_id_list])
+
+
+class ConfigCache:
+    """
+    Cache of the configuration of one system: each value is read once with g4_set_query, the next reads do not
+    touch the device. The values of a command are dropped by the setters, *_reset functions and restore_default of
+    this module (see 'invalidate_config'), the station map and active hubs only change with 'refresh'. Use
+    'config_cache' to get the cache of a system.
+
+    :Attributes:
+    - sys_id:   system id
+    - values:   cached values by (command, parameters)
+    """
+    def __init__(self, sys_id):
+        self.sys_id = sys_id
+        self.values = {}
+
+    def _get(self, command, key, read, *args):
+        value = self.values.get((command, key))
+        if value is None:
+            value = read(*args)
+            if value is None or value is False:
+                return None
+            if isinstance(value, list):
+                value = tuple(value)
+            self.values[(command, key)] = value
+        return value
+
+    def units(self, hub_id=0):
+        """
+        :return: cached 'get_units'
+        :rtype: tuple[str, str]
+        """
+        return self._get(COMMANDS.G4_CMD_UNITS, hub_id, get_units, self.sys_id, hub_id)
+
+    def filter(self, hub_id, return_pos=True):
+        """
+        :return: cached 'filter' (get)
+        :rtype: tuple[float, float, float, float]
+        """
+        return self._get(COMMANDS.G4_CMD_FILTER, (hub_id, return_pos),
+                         filter, self.sys_id, hub_id, return_pos)
+
+    def increment(self, hub_id, sen_id):
+        """
+        :return: cached 'increment' (get)
+        :rtype: tuple[float, float]
+        """
+        return self._get(COMMANDS.G4_CMD_INCREMENT, (hub_id, tuple(sen_id)),
+                         increment, self.sys_id, hub_id, sen_id)
+
+    def tip_offsets(self, hub_id, sen_id):
+        """
+        :return: cached 'tip_offsets' (get)
+        :rtype: tuple[float, float, float]
+        """
+        return self._get(COMMANDS.G4_CMD_TIP_OFFSET, (hub_id, tuple(sen_id)),
+                         tip_offsets, self.sys_id, hub_id, sen_id)
+
+    def frame_reference_orientation(self):
+        """
+        :return: cached 'frame_reference_orientation' (get)
+        :rtype: tuple[float, float, float]
+        """
+        return self._get(COMMANDS.G4_CMD_FOR_ROTATE, None, frame_reference_orientation, self.sys_id)
+
+    def frame_reference_translation(self):
+        """
+        :return: cached 'frame_reference_translation' (get)
+        :rtype: tuple[float, float, float]
+        """
+        return self._get(COMMANDS.G4_CMD_FOR_TRANSLATE, None, frame_reference_translation, self.sys_id)
+
+    def station_map(self, hub_id):
+        """
+        :return: cached 'get_station_map'
+        :rtype: tuple[bool, bool, bool]
+        """
+        return self._get(COMMANDS.G4_CMD_GET_STATION_MAP, hub_id, get_station_map, self.sys_id, hub_id)
+
+    def active_hubs(self, id_needed=False):
+        """
+        :return: cached 'get_active_hubs'
+        :rtype: int | tuple[int]
+        """
+        return self._get(COMMANDS.G4_CMD_GET_ACTIVE_HUBS, id_needed,
+                         get_active_hubs, self.sys_id, id_needed)
+
+    def populate(self, hub_id_list=None, sen_id=(0,)):
+        """
+        Read the whole configuration of the given hubs (by default all active hubs) into the cache
+        :param hub_id_list: hubs to read
+        :type hub_id_list: list[int]
+        :param sen_id: sensor(s) of which the increment and tip offset are read
+        :type sen_id: tuple[int]
+        """
+        if hub_id_list is None:
+            hub_id_list = self.active_hubs(True) or ()
+        self.frame_reference_orientation()
+        self.frame_reference_translation()
+        for hub_id in hub_id_list:
+            self.units(hub_id)
+            self.filter(hub_id, True)
+            self.filter(hub_id, False)
+            self.increment(hub_id, sen_id)
+            self.tip_offsets(hub_id, sen_id)
+            self.station_map(hub_id)
+
+    def invalidate(self, command=None):
+        """
+        Drop the cached values of a command (None for all commands)
+        :param command: command of which the values changed
+        :type command: COMMANDS
+        """
+        if command is None:
+            self.values.clear()
+        else:
+            for key in [key for key in self.values if key[0] == command]:
+                del self.values[key]
+
+    def refresh(self):
+        """
+        Read all cached values again from the device
+        """
+        keys = list(self.values)
+        self.values.clear()
+        readers = {COMMANDS.G4_CMD_UNITS: lambda key: self.units(key),
+                   COMMANDS.G4_CMD_FILTER: lambda key: self.filter(*key),
+                   COMMANDS.G4_CMD_INCREMENT: lambda key: self.increment(*key),
+                   COMMANDS.G4_CMD_TIP_OFFSET: lambda key: self.tip_offsets(*key),
+                   COMMANDS.G4_CMD_FOR_ROTATE: lambda key: self.frame_reference_orientation(),
+                   COMMANDS.G4_CMD_FOR_TRANSLATE: lambda key: self.frame_reference_translation(),
+                   COMMANDS.G4_CMD_GET_STATION_MAP: lambda key: self.station_map(key),
+                   COMMANDS.G4_CMD_GET_ACTIVE_HUBS: lambda key: self.active_hubs(key)}
+        for command, key in keys:
+            readers[command](key)
+
+
+_config_caches = {}
+
+
+def config_cache(sys_id):
+    """
+    Get the configuration cache of a system (created the first time)
+    :param sys_id: system id
+    :type sys_id: int
+    :return: the cache
+    :rtype: ConfigCache
+    """
+    cache = _config_caches.get(sys_id)
+    if cache is None:
+        cache = _config_caches[sys_id] = ConfigCache(sys_id)
+    return cache
+
+
+def invalidate_config(sys_id=-1, command=None):
+    """
+    Drop cached configuration values after a change on the device, called by the setters of this module
+    :param sys_id: system id (-1 for all systems)
+    :type sys_id: int
+    :param command: command of which the values changed (None for all commands)
+    :type command: COMMANDS
+    """
+    if sys_id == -1:
+        for cache in _config_caches.values():
+            cache.invalidate(command)
+    elif sys_id in _config_caches:
+        _config_caches[sys_id].invalidate(command)
+
+
 "Function and struct for stylus mode possible, but not needed"
@@ -0,0 +1,151 @@
+import numpy as np
+
+from G4Track import *
+from G4Orientation import euler_to_matrix, matrix_to_euler, matrix_to_quaternion, quaternion_to_matrix
+
+# size of each position unit in cm
+unit_cm = {UNITS.G4_TYPE_INCH.value: 2.54,
+           UNITS.G4_TYPE_FOOT.value: 30.48,
+           UNITS.G4_TYPE_CM.value: 1.0,
+           UNITS.G4_TYPE_METER.value: 100.0}
+
+position_units = (UNITS.G4_TYPE_INCH, UNITS.G4_TYPE_FOOT, UNITS.G4_TYPE_CM, UNITS.G4_TYPE_METER)
+orientation_units = (UNITS.G4_TYPE_EULER_DEGREE, UNITS.G4_TYPE_EULER_RADIAN, UNITS.G4_TYPE_QUATERNION)
+
+
+def convert_positions(pos, from_unit, to_unit):
+    """
+    Convert positions between inch, foot, cm and meter
+    :param pos: positions with shape (..., 3)
+    :type pos: np.ndarray
+    :param from_unit: unit of pos
+    :type from_unit: UNITS
+    :param to_unit: unit of the result
+    :type to_unit: UNITS
+    :return: the converted positions (float64)
+    :rtype: np.ndarray
+    """
+    return np.asarray(pos, dtype=np.float64) * (unit_cm[from_unit.value] / unit_cm[to_unit.value])
+
+
+def orientation_to_matrix(ori, unit):
+    """
+    :param ori: orientations as in G4SensorFrameData.ori, shape (..., 4) (or (..., 3) for Euler angles)
+    :type ori: np.ndarray
+    :param unit: unit of ori (Euler degree, Euler radian or quaternion)
+    :type unit: UNITS
+    :return: rotation matrices with shape (..., 3, 3)
+    :rtype: np.ndarray
+    """
+    ori = np.asarray(ori, dtype=np.float64)
+    if unit == UNITS.G4_TYPE_QUATERNION:
+        return quaternion_to_matrix(ori)
+    return euler_to_matrix(ori[..., :3], degrees=unit == UNITS.G4_TYPE_EULER_DEGREE)
+
+
+def matrix_to_orientation(matrix, unit):
+    """
+    :param matrix: rotation matrices with shape (..., 3, 3)
+    :type matrix: np.ndarray
+    :param unit: unit of the result (Euler degree, Euler radian or quaternion)
+    :type unit: UNITS
+    :return: orientations as in G4SensorFrameData.ori, shape (..., 4) (the 4th element is 0 for Euler angles)
+    :rtype: np.ndarray
+    """
+    if unit == UNITS.G4_TYPE_QUATERNION:
+        return matrix_to_quaternion(matrix)
+    ori = np.zeros(matrix.shape[:-2] + (4,))
+    ori[..., :3] = matrix_to_euler(matrix, degrees=unit == UNITS.G4_TYPE_EULER_DEGREE)
+    return ori
+
+
+def convert_orientations(ori, from_unit, to_unit):
+    """
+    Convert orientations between Euler angles in degrees or radians and quaternions
+    :param ori: orientations as in G4SensorFrameData.ori, shape (..., 4) (or (..., 3) for Euler angles)
+    :type ori: np.ndarray
+    :param from_unit: unit of ori
+    :type from_unit: UNITS
+    :param to_unit: unit of the result
+    :type to_unit: UNITS
+    :return: the converted orientations with shape (..., 4)
+    :rtype: np.ndarray
+    """
+    ori = np.asarray(ori, dtype=np.float64)
+    euler_units = (UNITS.G4_TYPE_EULER_DEGREE, UNITS.G4_TYPE_EULER_RADIAN)
+    if from_unit in euler_units and to_unit in euler_units:
+        result = np.zeros(ori.shape[:-1] + (4,))
+        result[..., :3] = ori[..., :3]
+        if from_unit != to_unit:
+            result[..., :3] = np.radians(result[..., :3]) if from_unit == UNITS.G4_TYPE_EULER_DEGREE \
+                else np.degrees(result[..., :3])
+        return result
+    if from_unit == to_unit:
+        return ori.copy()
+    return matrix_to_orientation(orientation_to_matrix(ori, from_unit), to_unit)
+
+
+class FrameTransform:
+    """
+    Host-side frame of reference and units, like G4_CMD_FOR_ROTATE, G4_CMD_FOR_TRANSLATE and G4_CMD_UNITS on the
+    device, but applied to batches of frames: several views of one stream are possible without reconfiguring the
+    device. A position p becomes R^T (p - translation) and an orientation R_s becomes R^T R_s, with R the rotation
+    of the frame of reference.
+
+    :Attributes:
+    - rotation:     frame of reference rotation (azimuth, elevation, roll) in degrees
+    - translation:  frame of reference translation [x, y, z] in cm
+    - pos_unit:     unit of the resulting positions
+    - ori_unit:     unit of the resulting orientations
+    """
+    def __init__(self, rotation=(0.0, 0.0, 0.0), translation=(0.0, 0.0, 0.0), pos_unit=UNITS.G4_TYPE_CM,
+                 ori_unit=UNITS.G4_TYPE_EULER_DEGREE):
+        self.rotation = tuple(rotation)
+        self.translation = tuple(translation)
+        self.pos_unit = pos_unit
+        self.ori_unit = ori_unit
+        self._matrix = euler_to_matrix(self.rotation)
+        self._translation = np.asarray(self.translation, dtype=np.float64)
+
+    def positions(self, pos, unit=UNITS.G4_TYPE_CM):
+        """
+        :param pos: positions with shape (..., 3)
+        :type pos: np.ndarray
+        :param unit: unit of pos
+        :type unit: UNITS
+        :return: the positions in this frame of reference and pos_unit
+        :rtype: np.ndarray
+        """
+        pos = convert_positions(pos, unit, UNITS.G4_TYPE_CM)
+        return convert_positions((pos - self._translation) @ self._matrix, UNITS.G4_TYPE_CM, self.pos_unit)
+
+    def orientations(self, ori, unit=UNITS.G4_TYPE_EULER_DEGREE):
+        """
+        :param ori: orientations with shape (..., 4)
+        :type ori: np.ndarray
+        :param unit: unit of ori
+        :type unit: UNITS
+        :return: the orientations in this frame of reference and ori_unit, shape (..., 4)
+        :rtype: np.ndarray
+        """
+        if not any(self.rotation):
+            return convert_orientations(ori, unit, self.ori_unit)
+        return matrix_to_orientation(self._matrix.T @ orientation_to_matrix(ori, unit), self.ori_unit)
+
+    def frames(self, view, pos_unit=UNITS.G4_TYPE_CM, ori_unit=UNITS.G4_TYPE_EULER_DEGREE):
+        """
+        Transform a structured array of frames (see G4Arrays)
+        :param view: structured array with dtype frame_dtype
+        :type view: np.ndarray
+        :param pos_unit: unit of the positions of view
+        :type pos_unit: UNITS
+        :param ori_unit: unit of the orientations of view
+        :type ori_unit: UNITS
+        :return: a transformed copy of view
+        :rtype: np.ndarray
+        """
+        result = view.copy()
+        sensors = result["G4_sensor_per_hub"]
+        sensors["pos"] = self.positions(sensors["pos"], pos_unit)
+        sensors["ori"] = self.orientations(sensors["ori"], ori_unit)
+        return result
@@ -1,10 +1,106 @@
+import os
+import threading
+import time
+
+import numpy as np
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.label import Label
 from kivy.uix.image import Image
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 
+from G4Track import *
+from G4Acquisition import AcquisitionEngine
+from G4Arrays import ring_view, ring_indices, positions, orientations, active_sensors
+from G4Recording import FrameRecorder
+from G4Report import ReportBuilder
+
+file_directory = os.path.dirname(os.path.abspath(__file__))
+src_cfg_file = os.path.join(file_directory, "first_calibration.g4c")
+recording_directory = os.path.join(file_directory, "recordings")
+display_rate = 30
+
+
+class LiveView(GridLayout):
+    """
+    Latest position and orientation of each sensor, with the frame rate and the dropped frames. The view reads the
+    ring buffer of an AcquisitionEngine on a Kivy Clock at display rate, so drawing never slows down the
+    acquisition thread and a slow frame of the UI only skips frames of the view.
+
+    :Attributes:
+    - engine:       the acquisition engine
+    - recorder:     the recorder of the session (None if not recording)
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.cols = 1
+        self.engine = None
+        self.recorder = None
+        self.status = Label(text='Connecting...')
+        self.add_widget(self.status)
+        self.readouts = {}
+        self._event = None
+        self._last_time = None
+        self._last_frames_read = 0
+        self._frame_rate = 0.0
+
+    def start(self, engine, recorder=None):
+        """
+        Show the frames of engine, refreshed at display_rate
+        """
+        self.engine = engine
+        self.recorder = recorder
+        for hub_id in engine.hub_id_list:
+            for sensor in range(G4_sensors_per_hub):
+                label = Label(text=f'Hub {hub_id}, sensor {sensor + 1}: -')
+                self.readouts[(hub_id, sensor)] = label
+                self.add_widget(label)
+        self._last_time = time.perf_counter()
+        self._event = Clock.schedule_interval(self.refresh, 1 / display_rate)
+
+    def stop(self):
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+
+    def refresh(self, dt):
+        engine = self.engine
+        ring = engine.ring
+        now = time.perf_counter()
+        if now - self._last_time >= 1:
+            self._frame_rate = (engine.frames_read - self._last_frames_read) / (now - self._last_time) \
+                / max(len(engine.hub_id_list), 1)
+            self._last_frames_read = engine.frames_read
+            self._last_time = now
+        lost = self.recorder.reader.overflows if self.recorder is not None else 0
+        self.status.text = f'{self._frame_rate:.0f} frames/s per hub, dropped: {engine.dropped_frames}, ' \
+                           f'empty reads: {engine.empty_reads}, not recorded: {lost}'
+
+        # latest frame of each hub among the last frames of the ring
+        frames, timestamps = ring_view(ring)
+        indices = ring_indices(ring, 4 * len(engine.hub_id_list))
+        if len(indices) == 0:
+            return
+        view = frames[indices]
+        pos, ori, active = positions(view), orientations(view), active_sensors(view)
+        for hub_id in engine.hub_id_list:
+            rows = np.flatnonzero(view["hub"] == hub_id)
+            if len(rows) == 0:
+                continue
+            i = rows[-1]
+            for sensor in range(G4_sensors_per_hub):
+                if active[i, sensor]:
+                    text = f'Hub {hub_id}, sensor {sensor + 1}: ' \
+                           f'x {pos[i, sensor, 0]:7.2f}  y {pos[i, sensor, 1]:7.2f}  z {pos[i, sensor, 2]:7.2f}  ' \
+                           f'az {ori[i, sensor, 0]:7.2f}  el {ori[i, sensor, 1]:7.2f}  roll {ori[i, sensor, 2]:7.2f}'
+                else:
+                    text = f'Hub {hub_id}, sensor {sensor + 1}: -'
+                label = self.readouts[(hub_id, sensor)]
+                if label.text != text:
+                    label.text = text
+
 
 class Example(App):
     def build(self):
@@ -13,6 +109,9 @@ class Example(App):
         self.window.size_hint = (0.6, 0.7)
         self.window.pos_hint = {"center_x":0.5, "center_y":0.5}
 
+        self.live = LiveView()
+        self.window.add_widget(self.live)
+
         self.comments = Label(text='Your comments:')
         self.window.add_widget(self.comments)
 
@@ -25,13 +124,71 @@ class Example(App):
                              size_hint = (1,0.4),
                              bold = True,
                              background_color = '#00FFCE')
-        self.button.bind(on_press=self.printHello)
+        self.button.bind(on_press=self.collect_data)
         self.window.add_widget(self.button)
 
+        self.reports = ReportBuilder()
+        self.jobs = []
+        self.engine = None
+        self.recorder = None
+        # a new recording per launch, the report and the Excel file are named after it
+        os.makedirs(recording_directory, exist_ok=True)
+        self.recording_path = os.path.join(recording_directory, time.strftime("session_%Y%m%d_%H%M%S.g4r"))
         return self.window
 
-    def printHello(self, instance):
-        self.comments.text = 'Printed'
+    def on_start(self):
+        # initializing the system takes some seconds, do it next to the UI
+        threading.Thread(target=self.connect, daemon=True).start()
+
+    def connect(self):
+        connected, dongle_id = initialize_system(src_cfg_file)
+        hub_id_list = get_active_hubs(dongle_id, True) if connected else None
+        Clock.schedule_once(lambda dt: self.on_connected(dongle_id, hub_id_list))
+
+    def on_connected(self, dongle_id, hub_id_list):
+        if not hub_id_list:
+            self.live.status.text = 'Failed to connect.'
+            return
+        self.engine = AcquisitionEngine(dongle_id, hub_id_list)
+        self.recorder = FrameRecorder(self.engine.ring, self.recording_path)
+        self.recorder.start()
+        self.engine.start()
+        self.live.start(self.engine, self.recorder)
+
+    def collect_data(self, instance):
+        """
+        Start the PDF report and the Excel export of the recording in the worker process, the UI stays responsive
+        """
+        if self.jobs:
+            return
+        if self.recorder is None:
+            self.comments.text = 'Nothing recorded yet.'
+            return
+        # the frames waiting in the ring buffer are written first, so the jobs see the session up to now
+        self.recorder.write_pending()
+        base = os.path.splitext(self.recording_path)[0]
+        self.jobs = [self.reports.submit(self.recording_path, base + "_report.pdf", self.user.text),
+                     self.reports.submit_excel(self.recording_path, base + ".xlsx")]
+        self.comments.text = 'Collecting data...'
+        Clock.schedule_interval(self.check_jobs, 0.2)
+
+    def check_jobs(self, dt):
+        if not all(job.done() for job in self.jobs):
+            return True
+        errors = [job.exception() for job in self.jobs if job.exception() is not None]
+        excel_rows = None if errors else self.jobs[1].result()
+        self.comments.text = f'Error: {errors[0]}' if errors else \
+            'Printed' if excel_rows is not None else 'Printed (pdf only, see console)'
+        self.jobs = []
+        return False
+
+    def on_stop(self):
+        self.live.stop()
+        if self.engine is not None:
+            self.engine.stop()
+            self.recorder.stop()
+            close_sensor()
+        self.reports.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+import gc
+import time
+
+from G4Track import *
+from G4Simulation import SimulatedG4Track
+
+n_reads = 100000  # for the simulated library, n_reads // 20
+
+
+class StaticG4Track(SimulatedG4Track):
+    """
+    Simulated library that returns at once without filling the frames, so only the cost of the wrapper is measured
+    """
+    def g4_get_frame_data(self, fd_array, sys_id, hub_id_list, num_hubs):
+        return (len(self.hub_ids) << 16) | getattr(num_hubs, "value", num_hubs)
+
+
+class CountingGC:
+    """
+    Count the garbage collections (all generations) while it is active
+    """
+    def __enter__(self):
+        self.collections = 0
+        gc.callbacks.append(self._callback)
+        return self
+
+    def __exit__(self, *exc):
+        gc.callbacks.remove(self._callback)
+
+    def _callback(self, phase, info):
+        if phase == "start":
+            self.collections += 1
+
+
+def bench(name, read, n=n_reads):
+    """
+    Time a number of reads of a frame
+    :param name: name to print
+    :type name: str
+    :param read: function reading one frame
+    :param n: number of reads
+    :type n: int
+    """
+    with CountingGC() as counter:
+        start_time = time.perf_counter()
+        for _ in range(n):
+            read()
+        elapsed_time = time.perf_counter() - start_time
+    print(f"{name:<28}{elapsed_time / n * 1e6:8.2f} us/read{counter.collections:8d} gc runs")
+
+
+for backend in (StaticG4Track(hub_ids=(0, 1, 2, 3)), SimulatedG4Track(hub_ids=(0, 1, 2, 3))):
+    print(type(backend).__name__)
+    n = n_reads if isinstance(backend, StaticG4Track) else n_reads // 20
+    use_backend(backend)
+    connected, dongle_id = initialize_system("simulated.g4c")
+
+    reader = FrameReader(dongle_id, [0])
+    out = G4FrameData()
+
+    bench("get_frame_data", lambda: get_frame_data(dongle_id, [0]), n)
+    bench("FrameReader.read", reader.read, n)
+    bench("FrameReader.read(out)", lambda: reader.read(out), n)
+
+    hub_readers = [FrameReader(dongle_id, [hub_id]) for hub_id in range(4)]
+    multi_reader = FrameReader(dongle_id, range(4))
+
+    bench("4 hubs, 4x FrameReader.read", lambda: [hub_reader.read() for hub_reader in hub_readers], n)
+    bench("4 hubs, read_hubs", multi_reader.read_hubs, n)
+
+    enable_instrumentation()
+    bench("4 hubs, read_hubs, metrics", multi_reader.read_hubs, n)
+    disable_instrumentation()
+
+    close_sensor()
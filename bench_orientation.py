@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+
+from G4Orientation import *
+
+n_samples = 1000000
+rng = np.random.default_rng(0)
+
+euler = rng.uniform([-180, -89, -180], [180, 89, 180], size=(n_samples, 3))
+quaternion = euler_to_quaternion(euler)
+matrix = euler_to_matrix(euler)
+other = euler_to_quaternion(rng.uniform([-180, -89, -180], [180, 89, 180], size=(n_samples, 3)))
+t = rng.uniform(0, 1, n_samples)
+timestamps = np.arange(n_samples) / 120
+
+
+def bench(name, function, repeat=3):
+    """
+    Time a vectorized function on n_samples orientations (best of repeat)
+    :param name: name to print
+    :type name: str
+    :param function: function processing n_samples orientations
+    :param repeat: number of runs
+    :type repeat: int
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start_time)
+    print(f"{name:<28}{best * 1e3:8.1f} ms{n_samples / best / 1e6:8.1f} M samples/s")
+
+
+print(f"{n_samples} samples")
+bench("euler_to_matrix", lambda: euler_to_matrix(euler))
+bench("matrix_to_euler", lambda: matrix_to_euler(matrix))
+bench("euler_to_quaternion", lambda: euler_to_quaternion(euler))
+bench("quaternion_to_euler", lambda: quaternion_to_euler(quaternion))
+bench("quaternion_to_matrix", lambda: quaternion_to_matrix(quaternion))
+bench("matrix_to_quaternion", lambda: matrix_to_quaternion(matrix))
+bench("relative_orientation", lambda: relative_orientation(quaternion, other))
+bench("slerp", lambda: slerp(quaternion, other, t))
+bench("angular_velocity", lambda: angular_velocity(quaternion, timestamps))
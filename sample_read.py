@@ -1,30 +1,33 @@
 import numpy as np
 
 from G4Track import *
-import time
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
+from G4Acquisition import AcquisitionEngine, wait_until_stable
+from G4Plot import TrajectoryPlot
 
 file_directory = os.path.dirname(os.path.abspath(__file__))
 src_cfg_file = os.path.join(file_directory, "first_calibration.g4c")
 
 
-def calibration_to_center(sys_id):
+def calibration_to_center(sys_id, tolerance=0.1, timeout=5.0):
     """
     Calibrate the system (facing the source), so the x-axis points to the right of the user, the y-axis to the front
-    and the z-axis to the ceiling. Keep in mind that the hemisphere of the source is dynamic and needs time to adapt.
+    and the z-axis to the ceiling. Keep in mind that the hemisphere of the source is dynamic and needs time to adapt,
+    the calibration waits until the positions are stable (see 'wait_until_stable').
     :param sys_id: system id
     :type sys_id: int
-    :return: the sensor who is on the left and right hand
-    :rtype: bool
+    :param tolerance: maximum change of the position between two frames to be stable (cm)
+    :type tolerance: float
+    :param timeout: maximum time to wait for stable data (seconds)
+    :type timeout: float
+    :return: the hub id, None if the data did not settle
+    :rtype: int
     """
-    time.sleep(2)  # wait for the hemisphere to adapt
     hub_id = get_active_hubs(sys_id, True)[0]
     map = get_station_map(sys_id,hub_id)
 
-    pos0, active_count, data_hubs = None, 0, 0
-    while active_count == 0 & data_hubs == 0:
-        pos0, active_count, data_hubs = get_frame_data(sys_id, [hub_id])
+    pos0 = wait_until_stable(sys_id, hub_id, tolerance, timeout=timeout)  # wait for the hemisphere to adapt
+    if pos0 is None:
+        return None
 
     frame_reference_orientation(sys_id, (90,180,0))
     #print(frame_reference_orientation(sys_id))
@@ -35,30 +38,25 @@ def calibration_to_center(sys_id):
                                          min(sen1.pos[1], sen2.pos[1]),
                                          min(sen1.pos[2], sen2.pos[2])))
 
-    time.sleep(2)
+    if wait_until_stable(sys_id, hub_id, tolerance, timeout=timeout) is None:
+        return None
     return hub_id
 
 
 connected, dongle_id = initialize_system(src_cfg_file)
 print(f"Dongle id: {dongle_id}")
 
-start_time = time.time()
-elapsed_time = time.time() - start_time
 if connected:
     print(set_units(dongle_id))
     hub_id = calibration_to_center(dongle_id)
+    if hub_id is None:
+        hub_id = get_active_hubs(dongle_id, True)[0]
 
-    while elapsed_time < 1:
-        frame_data, active_count, data_hubs = get_frame_data(dongle_id, [hub_id])
-        elapsed_time = time.time() - start_time
+    with AcquisitionEngine(dongle_id, [hub_id]) as engine:
+        # the frames are collected in the background, the plot shows the last seconds until its window is closed
+        TrajectoryPlot(engine.ring, [hub_id], frame_rate=engine.frame_rate).show()
 
-        if (active_count, data_hubs) == (1, 1):
-            sensor2 = frame_data.G4_sensor_per_hub[1]
-            sensor1 = frame_data.G4_sensor_per_hub[0]
-            # print(f"Sensor {1}:")
-            print(f"  Position sensor 1: (x: {sensor1.pos[0]}, y: {sensor1.pos[1]}, z: {sensor1.pos[2]})              "
-                  f"Position sensor 2: (x: {sensor2.pos[0]}, y: {sensor2.pos[1]}, z: {sensor2.pos[2]})")
-            #print(f"  Orientation: (qx: {sensor1.ori[0]}, qy: {sensor1.or
+    print(f"Frames: {engine.frames_read}, dropped: {engine.dropped_frames}")
 
 else:
     print("Failed to connect.")
@@ -0,0 +1,45 @@
+import os
+
+from G4Track import *
+from G4Acquisition import FrameRingBuffer, wait_until_stable
+from G4Recording import FrameRecorder
+from G4Simulation import ReplayG4Track
+
+src_cfg_file = os.path.join(os.path.dirname(__file__), "first_calibration.g4c")
+
+
+def record(path, hub_ids, frames=240, frame_rate=120):
+    ring = FrameRingBuffer(1024)
+    recorder = FrameRecorder(ring, path)
+    fd = G4FrameData()
+    with recorder:
+        for frame in range(frames):
+            for hub_id in hub_ids:
+                fd.hub = hub_id
+                fd.frame = frame
+                fd.stationMap = 0b11
+                fd.G4_sensor_per_hub[0].pos[:] = [hub_id, 0, 10]
+                fd.G4_sensor_per_hub[1].pos[:] = [hub_id, 5, 10]
+                ring.write(fd, frame / frame_rate)
+            recorder.write_pending()
+
+
+def test_replay_non_zero_hubs(tmp_path):
+    path = str(tmp_path / "replay")
+    record(path, [1, 2])
+    use_backend(ReplayG4Track(path, speed=None))
+
+    connected, sys_id = initialize_system(src_cfg_file)
+    assert connected
+    assert list(get_active_hubs(sys_id, True)) == [1, 2]
+    assert get_frame_rate(sys_id) == 120
+    assert set_units(sys_id)
+
+    fd, active_hubs, hub_count = get_frame_data(sys_id, [2])
+    assert (active_hubs, hub_count) == (2, 1)
+    assert fd.hub == 2 and list(fd.G4_sensor_per_hub[1].pos) == [2, 5, 10]
+
+    # the steps of calibration_to_center (sample_read.py)
+    hub_id = get_active_hubs(sys_id, True)[0]
+    assert wait_until_stable(sys_id, hub_id, timeout=1.0) is not None
+    assert frame_reference_orientation(sys_id, (90, 180, 0))
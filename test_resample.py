@@ -0,0 +1,37 @@
+import numpy as np
+
+from G4Track import *
+from G4Acquisition import FrameRingBuffer
+from G4Resample import Resampler
+
+
+def write_frames(ring, hub_ids, frames, frame_rate=120):
+    fd = G4FrameData()
+    for frame in frames:
+        for hub_id in hub_ids:
+            fd.hub = hub_id
+            fd.frame = frame
+            fd.stationMap = 1
+            fd.G4_sensor_per_hub[0].pos[0] = frame
+            fd.G4_sensor_per_hub[0].ori[:] = [0, 0, 0, 1]
+            ring.write(fd, (frame + 0.5) / frame_rate)
+
+
+def test_stalled_hub():
+    ring = FrameRingBuffer(1024)
+    resampler = Resampler(ring, [1, 2])
+    write_frames(ring, [1, 2], range(30))
+    times, pos, ori, valid = resampler.poll()
+    assert len(times) > 0 and valid[:, :, 0].all()
+
+    # hub 2 stops sending: its pending frames are trimmed to the last one
+    write_frames(ring, [1], range(30, 90))
+    times, pos, ori, valid = resampler.poll()
+    assert len(times) > 0
+    assert valid[:, 0, 0].all()
+    assert not valid[:, 1].any()
+
+    write_frames(ring, [1], range(90, 120))
+    times, pos, ori, valid = resampler.poll()
+    assert len(times) > 0
+    assert not valid[:, 1].any()